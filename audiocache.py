@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import traceback
+
+""" On-disk cache of downloaded audio.
+Tracks are added once their stream buffer (see streambuffer.py) has downloaded them completely,
+so looped and replayed tracks start from a local file instead of streaming from YouTube again. """
+
+INDEX_FILENAME = "index.json"
+
+class AudioCache:
+    """ Audio files keyed by video ID, bounded by their total size. The least recently played files are deleted first.
+    The index keeps each file's size and the codec information needed to play it without probing. It's saved whenever files are
+    added or deleted, a hit only reorders it and is saved by flush(), periodically and at shutdown. """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.index_path: str = os.path.join(directory, INDEX_FILENAME)
+        self.entries: dict[str, dict] = {} # video ID -> {"size", "codec", "bitrate", "sample_rate", "last_played"}, least recently played first.
+        self.total_bytes: int = 0
+        self.lock: threading.Lock = threading.Lock() # put() runs in the stream buffer's download thread.
+        self.save_lock: threading.Lock = threading.Lock() # Keeps two saves from writing the temporary file at once.
+        self.dirty: bool = False # Set by get(), the saved order is behind until the next flush().
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def get_path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.audio")
+
+    def load(self) -> None:
+        if not os.path.exists(self.index_path):
+            return
+
+        try:
+            with open(self.index_path, "r") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            logging.error(f"Failed to read audio cache index in function load(), starting with an empty cache; {traceback.format_exc()}")
+            return
+
+        for video_id, entry in entries.items():
+            if os.path.exists(self.get_path(video_id)): # Files deleted by hand are forgotten.
+                self.entries[video_id] = entry
+                self.total_bytes += entry["size"]
+
+    def flush(self) -> None:
+        """ Saves the index if a hit changed it since the last save. """
+
+        with self.lock:
+            if not self.dirty:
+                return
+        self.save()
+
+    def save(self) -> None:
+        """ Copies the index under the lock and writes it outside of it, so lookups aren't blocked by the write. """
+
+        with self.save_lock:
+            with self.lock:
+                entries = {video_id: entry.copy() for video_id, entry in self.entries.items()}
+                self.dirty = False
+
+            temp_path = self.index_path + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump(entries, f)
+                os.replace(temp_path, self.index_path)
+            except OSError:
+                logging.error(f"Failed to write audio cache index in function save(); {traceback.format_exc()}")
+                with self.lock:
+                    self.dirty = True # Try again on the next flush.
+
+    def contains(self, video_id: str) -> bool:
+        with self.lock:
+            return video_id in self.entries
+
+    def get(self, video_id: str) -> dict | None:
+        """ Returns the stream information of a cached track with "url" set to its local file, None if it isn't cached. """
+
+        with self.lock:
+            entry = self.entries.pop(video_id, None)
+            if entry is None:
+                return None
+
+            self.dirty = True
+            if not os.path.exists(self.get_path(video_id)):
+                self.total_bytes -= entry["size"]
+                return None
+
+            entry["last_played"] = time.time()
+            self.entries[video_id] = entry # Move to the end so the least recently played files get evicted first.
+
+            return {
+                "url": self.get_path(video_id),
+                "codec": entry["codec"],
+                "bitrate": entry["bitrate"],
+                "sample_rate": entry["sample_rate"]
+            }
+
+    def put(self, video_id: str, file_path: str, stream: dict) -> None:
+        """ Copies a completely downloaded track into the cache. stream holds its codec information, see Mixer.get_stream_info(). """
+
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return
+
+        try:
+            shutil.copyfile(file_path, self.get_path(video_id) + ".tmp")
+            os.replace(self.get_path(video_id) + ".tmp", self.get_path(video_id))
+        except OSError:
+            logging.error(f"Failed to write audio file of \"{video_id}\" in function put(); {traceback.format_exc()}")
+            return
+
+        with self.lock:
+            old = self.entries.pop(video_id, None)
+            if old is not None:
+                self.total_bytes -= old["size"]
+
+            self.entries[video_id] = {
+                "size": size,
+                "codec": stream.get("codec"),
+                "bitrate": stream.get("bitrate"),
+                "sample_rate": stream.get("sample_rate"),
+                "last_played": time.time()
+            }
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.total_bytes -= self.entries.pop(oldest)["size"]
+                try:
+                    os.remove(self.get_path(oldest))
+                except OSError:
+                    logging.warning(f"Failed to delete evicted audio file of \"{oldest}\" in function put(); {traceback.format_exc()}")
+
+        self.save() # Right away, the index has to know about every file in the directory.
@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import statistics
+import tempfile
+import time
+import discord
+from yt_dlp import YoutubeDL
+from ydlpool import YDLPool
+from cache import ExtractionCache, SearchCache
+from extractor import FakeExtractor
+from resolver import Resolver
+from webmsource import ConnectionPool, WebMOpusSource
+from tracks import Track, TrackQueue
+
+""" Benchmarks for the bot's hot paths.
+Run with: python3 bench.py <benchmark> [options]
+This file does not import client.py, so it can run without a bot token. Only the demuxer benchmark needs ffmpeg. """
+
+BENCH_YDL_OPTIONS: dict = {"format": "bestaudio[acodec=opus]/bestaudio", "noplaylist": True, "quiet": True} # Same as YDL_OPTIONS in client.py.
+
+def report(name: str, timings: list[float]) -> None:
+    """ Prints mean, median and tail latency of a list of timings (in seconds). """
+
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<32} n={len(timings):<6} mean={statistics.mean(timings) * 1000:9.3f}ms median={statistics.median(timings) * 1000:9.3f}ms p95={p95 * 1000:9.3f}ms")
+
+def bench_ydl_pool(args: argparse.Namespace) -> None:
+    """ Compares building a YoutubeDL per call (old fetch_track behaviour) with checking one out of a YDLPool.
+    Pass --url to include a real extraction in each call. """
+
+    def work(yt: YoutubeDL) -> None:
+        if args.url:
+            yt.extract_info(args.url, download=False)
+
+    per_call = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        with YoutubeDL(BENCH_YDL_OPTIONS) as yt:
+            work(yt)
+        per_call.append(time.perf_counter() - start)
+
+    pool = YDLPool(BENCH_YDL_OPTIONS, size=1, max_uses=args.iterations + 1)
+    pooled = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        with pool.checkout() as yt:
+            work(yt)
+        pooled.append(time.perf_counter() - start)
+    pool.close()
+
+    report("YoutubeDL per call", per_call)
+    report("YDLPool checkout", pooled)
+
+""" Resolution path benchmarks.
+These run the Resolver (the code behind add, playlistselect and ytsearch) against FakeExtractor,
+so results only depend on the configured latency, jitter and failure rate, not on YouTube. """
+
+def make_resolver(args: argparse.Namespace, concurrency: int, directory: str) -> Resolver:
+    """ Returns a resolver with empty caches, the extraction cache is written to a file in directory like the bot does. """
+
+    extractor = FakeExtractor(args.latency, args.jitter, args.failure_rate, args.playlist_size, seed=args.seed)
+    cache_path = os.path.join(directory, f"extraction_cache_{time.perf_counter_ns()}.json")
+
+    return Resolver(extractor, ExtractionCache(cache_path, 100000, 600), SearchCache(100000, 86400, 300), concurrency)
+
+async def run_batch(resolver: Resolver, queries: list[str]) -> tuple[float, list[float]]:
+    """ Resolves queries like add does. Returns the total time and the time at which each query resolved. """
+
+    start = time.perf_counter()
+    latencies = []
+    for task in resolver.start_resolving(queries): # Awaited in order, like add consumes them.
+        await task
+        latencies.append(time.perf_counter() - start)
+
+    return time.perf_counter() - start, latencies
+
+async def run_searches(resolver: Resolver, queries: list[str], concurrency: int) -> tuple[float, list[float]]:
+    """ Runs ytsearch's fetch_track() call for every query, concurrency users at a time. """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def search(query: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(resolver.fetch_track, "std_query", query, False)
+            except Exception:
+                pass # Failures still count towards latency, like the error message a user would get.
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(search(query) for query in queries))
+
+    return time.perf_counter() - start, latencies
+
+def report_batch(name: str, total: float, latencies: list[float]) -> None:
+    """ Prints throughput, time to the first result and tail latency of a batch. """
+
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<44} total={total * 1000:9.1f}ms throughput={len(latencies) / total:8.2f}/s first={latencies[0] * 1000:8.1f}ms p50={statistics.median(latencies) * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms p99={p99 * 1000:8.1f}ms")
+
+def bench_resolution(args: argparse.Namespace) -> None:
+    print(f"FakeExtractor latency={args.latency}s jitter={args.jitter}s failure_rate={args.failure_rate}")
+    logging.disable(logging.ERROR) # Simulated failures are logged with a full traceback by start_resolving().
+
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in args.batch_sizes:
+            for concurrency in args.concurrency:
+                label = f"batch={batch_size} concurrency={concurrency}"
+
+                if "add" in args.scenarios: # Unique search queries, every one is a cold search.
+                    resolver = make_resolver(args, concurrency, directory)
+                    queries = [f"bench search query {i}" for i in range(batch_size)]
+                    report_batch(f"add (cold) {label}", *asyncio.run(run_batch(resolver, queries)))
+                    report_batch(f"add (repeated) {label}", *asyncio.run(run_batch(resolver, queries)))
+
+                if "playlistselect" in args.scenarios: # playlistselect feeds the saved playlist's webpage URLs to add.
+                    resolver = make_resolver(args, concurrency, directory)
+                    queries = [f"https://www.youtube.com/watch?v={resolver.extractor.get_fake_id(str(i))}" for i in range(batch_size)]
+                    report_batch(f"playlistselect (cold) {label}", *asyncio.run(run_batch(resolver, queries)))
+                    report_batch(f"playlistselect (warm) {label}", *asyncio.run(run_batch(resolver, queries)))
+
+                if "ytsearch" in args.scenarios: # Users searching at the same time, half of the searches are repeats.
+                    resolver = make_resolver(args, concurrency, directory)
+                    queries = [f"bench search query {i % max(batch_size // 2, 1)}" for i in range(batch_size)]
+                    report_batch(f"ytsearch {label}", *asyncio.run(run_searches(resolver, queries, concurrency)))
+
+""" Playback source benchmarks.
+Compare WebMOpusSource with the FFmpeg passthrough source it replaces. Packets are read as fast as possible
+instead of in real time, so the CPU figures are the cost of demuxing the whole sample. """
+
+def read_packets(create_source, seconds: int, packets: int) -> tuple[float, float, float]:
+    """ Creates a source and reads packets from it, returns (time to the first packet, total time, CPU seconds).
+    CPU time includes the worker threads of this process and every child process that exited. """
+
+    cpu_start = time.process_time() + sum(resource.getrusage(resource.RUSAGE_CHILDREN)[:2])
+    start = time.perf_counter()
+    source = create_source(seconds)
+    source.read()
+    first_packet = time.perf_counter() - start
+
+    for _ in range(packets - 1):
+        if not source.read():
+            break
+    source.cleanup() # Waits for FFmpeg to exit, so its CPU time is in RUSAGE_CHILDREN.
+    total = time.perf_counter() - start
+
+    cpu = time.process_time() + sum(resource.getrusage(resource.RUSAGE_CHILDREN)[:2]) - cpu_start
+    return first_packet, total, cpu
+
+def bench_demuxer(args: argparse.Namespace) -> None:
+    url = args.source
+    if url.startswith("https://www.youtube.com/") or url.startswith("https://youtu.be/"):
+        with YoutubeDL(BENCH_YDL_OPTIONS) as yt:
+            url = yt.extract_info(url, download=False)["url"]
+
+    pool = ConnectionPool()
+    sources = {
+        "FFmpegOpusAudio copy (1 process)": lambda seconds: discord.FFmpegOpusAudio(url, codec="copy", before_options=f"-ss {seconds}", options="-vn"),
+        "WebMOpusSource (0 processes)": lambda seconds: WebMOpusSource(url, seconds, pool)
+    }
+
+    for seek in args.seek:
+        for name, create_source in sources.items():
+            results = [read_packets(create_source, seek, args.seconds * 50) for _ in range(args.iterations)] # 50 packets per second of audio.
+            first_packets, totals, cpu_times = zip(*results)
+            print(f"{name:<36} seek={seek:<5} first packet={statistics.median(first_packets) * 1000:8.1f}ms total={statistics.median(totals) * 1000:8.1f}ms cpu={statistics.median(cpu_times) * 1000:8.1f}ms")
+
+""" Queue benchmarks.
+Compare the old list of 5-tuples with TrackQueue on the operations the bot performs: queueing, playing from the head,
+repositioning and title lookups. """
+
+def make_queue_entries(size: int) -> list[tuple[None, str, int, str, str]]:
+    return [(None, f"Bench Track Title {i}", 180, f"https://i.ytimg.com/vi/{i}/hqdefault.jpg", f"https://www.youtube.com/watch?v={i:011d}") for i in range(size)]
+
+def time_operation(operation) -> float:
+    start = time.perf_counter()
+    operation()
+    return time.perf_counter() - start
+
+def bench_queue(args: argparse.Namespace) -> None:
+    for size in args.sizes:
+        entries = make_queue_entries(size)
+        lookups = [f"track title {i}" for i in range(0, size, max(size // args.lookups, 1))]
+
+        def list_append() -> list:
+            queue = []
+            for entry in entries:
+                queue.append(entry)
+            return queue
+
+        def track_queue_append() -> TrackQueue:
+            queue = TrackQueue()
+            for track in tracks:
+                queue.append(track)
+            return queue
+
+        def list_drain() -> None:
+            queue = list(entries)
+            while queue:
+                queue.pop(0)
+
+        def track_queue_drain() -> None:
+            queue = track_queue.copy()
+            while queue:
+                queue.pop(0)
+
+        def list_moves() -> None:
+            queue = list(entries)
+            for i in range(args.moves):
+                queue.insert(0, queue.pop(len(queue) // 2))
+
+        def track_queue_moves() -> None:
+            queue = track_queue.copy()
+            for i in range(args.moves):
+                queue.move(len(queue) // 2, 0)
+
+        def list_random_drain() -> None: # The random mode pick play_next() made for every track.
+            queue = list(entries)
+            while queue:
+                queue.pop(queue.index(random.choice(queue)))
+
+        def track_queue_random_drain() -> None:
+            queue = track_queue.copy()
+            while queue:
+                queue.take(queue.pick_random())
+
+        def list_loop_removals() -> None: # remove and select dropping the entry from the loop queue.
+            loop = list(entries)
+            for entry in entries[::-1][:args.moves]:
+                if entry in loop:
+                    loop.remove(entry)
+
+        def track_queue_loop_removals() -> None:
+            loop = track_queue.copy()
+            for track in tracks[::-1][:args.moves]:
+                if track in loop:
+                    loop.remove(track)
+
+        def list_lookups() -> None: # The scan select, remove and getindex ran on every call.
+            for query in lookups:
+                next((entry for entry in entries if query.lower().replace(" ", "") in entry[1].lower().replace(" ", "")), None)
+
+        def track_queue_lookups() -> None: # Title index lookups.
+            for query in lookups:
+                track_queue.find(query)
+
+        tracks = [Track(title, duration, thumbnail_url, webpage) for _, title, duration, thumbnail_url, webpage in entries] # Queued tracks never had a stream URL.
+        track_queue = track_queue_append()
+        print(f"queue size={size}")
+        for name, list_operation, track_queue_operation in (
+            ("append all", list_append, track_queue_append),
+            ("drain from head", list_drain, track_queue_drain),
+            (f"{args.moves} moves to head", list_moves, track_queue_moves),
+            ("random drain", list_random_drain, track_queue_random_drain),
+            (f"{args.moves} loop removals", list_loop_removals, track_queue_loop_removals),
+            (f"{len(lookups)} lookups", list_lookups, track_queue_lookups)
+        ):
+            report(f"list {name}", [time_operation(list_operation) for _ in range(args.iterations)])
+            report(f"TrackQueue {name}", [time_operation(track_queue_operation) for _ in range(args.iterations)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for MusicBot.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ydl_pool_parser = subparsers.add_parser("ydlpool", help="Per-call YoutubeDL construction against pooled instances.")
+    ydl_pool_parser.add_argument("--iterations", type=int, default=20)
+    ydl_pool_parser.add_argument("--url", type=str, default=None, help="Optional YouTube URL to extract on every call (requires network).")
+    ydl_pool_parser.set_defaults(func=bench_ydl_pool)
+
+    resolution_parser = subparsers.add_parser("resolution", help="Throughput and tail latency of add, playlistselect and ytsearch against FakeExtractor.")
+    resolution_parser.add_argument("--scenarios", nargs="+", choices=["add", "playlistselect", "ytsearch"], default=["add", "playlistselect", "ytsearch"])
+    resolution_parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 30])
+    resolution_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8])
+    resolution_parser.add_argument("--latency", type=float, default=0.2, help="Mean extraction latency in seconds.")
+    resolution_parser.add_argument("--jitter", type=float, default=0.1, help="Extraction latency varies uniformly by up to this many seconds.")
+    resolution_parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of an extraction failing.")
+    resolution_parser.add_argument("--playlist-size", type=int, default=50)
+    resolution_parser.add_argument("--seed", type=int, default=None)
+    resolution_parser.set_defaults(func=bench_resolution)
+
+    demuxer_parser = subparsers.add_parser("demuxer", help="Startup latency and CPU time of WebMOpusSource against FFmpeg passthrough (requires ffmpeg).")
+    demuxer_parser.add_argument("source", type=str, help="YouTube URL, stream URL or local WebM file.")
+    demuxer_parser.add_argument("--seconds", type=int, default=60, help="Seconds of audio read from every source.")
+    demuxer_parser.add_argument("--seek", nargs="+", type=int, default=[0, 120], help="Start positions in seconds.")
+    demuxer_parser.add_argument("--iterations", type=int, default=5)
+    demuxer_parser.set_defaults(func=bench_demuxer)
+
+    queue_parser = subparsers.add_parser("queue", help="List of tuples against TrackQueue for queue operations.")
+    queue_parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 50000])
+    queue_parser.add_argument("--moves", type=int, default=1000)
+    queue_parser.add_argument("--lookups", type=int, default=100)
+    queue_parser.add_argument("--iterations", type=int, default=5)
+    queue_parser.set_defaults(func=bench_queue)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import time
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+""" Caches for extracted track information.
+Used by Mixer.fetch_track() to avoid running a full yt_dlp extraction
+for tracks and searches that have already been resolved. """
+
+VIDEO_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|embed/|v/|shorts/)([A-Za-z0-9_-]{11})') # Matches the 11 character video ID in most YouTube URL forms.
+
+def get_video_id(url: str) -> str | None:
+    """ Returns the canonical video ID of a YouTube URL, None if it can't be found. """
+
+    match = VIDEO_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    return None
+
+def normalize_query(query: str) -> str:
+    """ Lowercases a search query and collapses whitespace so that
+    "Lofi  Beats" and "lofi beats" share the same cache entry. """
+
+    return " ".join(query.lower().split())
+
+def get_stream_expiry(stream_url: str) -> int:
+    """ Returns the unix timestamp stored in the "expire" parameter of a googlevideo URL.
+    Returns 0 if the URL has no expiry. """
+
+    try:
+        params = parse_qs(urlparse(stream_url).query)
+        return int(params["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return 0
+
+def get_audio_formats(info: dict) -> list[dict]:
+    """ Returns the URL, codec, bitrate and sample rate of every audio-only format of a yt_dlp info dictionary,
+    so a lower-bitrate format can be picked for a voice channel without extracting again. """
+
+    return [
+        {"url": f["url"], "acodec": f["acodec"], "abr": f["abr"], "asr": f.get("asr")}
+        for f in info.get("formats") or []
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none") and f.get("abr") and f.get("url")
+        and f.get("protocol") in ("https", "http") and "drc" not in str(f.get("format_id")) # Dynamic range compressed variants sound different.
+    ]
+
+def trim_info(info: dict) -> dict:
+    """ Keeps only the fields of a yt_dlp info dictionary that the bot needs to queue and play a track. """
+
+    return {
+        "id": info.get("id"),
+        "title": info["title"],
+        "duration": info.get("duration", 0),
+        "thumbnail": info.get("thumbnail"),
+        "webpage_url": info["webpage_url"],
+        "url": info["url"],
+        "expire": get_stream_expiry(info["url"]),
+        "acodec": info.get("acodec"), # Codec, bitrate and sample rate of the stream, lets playback skip ffprobe.
+        "abr": info.get("abr"),
+        "asr": info.get("asr"),
+        "audio_formats": get_audio_formats(info)
+    }
+
+class ExtractionCache:
+    """ Cache of trimmed track information keyed by video ID. Updates mark it dirty, flush() saves it to a json file
+    periodically and at shutdown, so a burst of extractions doesn't rewrite the whole file once per track. """
+
+    def __init__(self, file_path: str, max_entries: int, expiry_margin: int) -> None:
+        self.file_path: str = file_path
+        self.max_entries: int = max_entries
+        self.expiry_margin: int = expiry_margin # Seconds before a stream URL expires at which it's no longer served from the cache.
+        self.videos: dict[str, dict] = {}
+        self.lock: threading.Lock = threading.Lock() # fetch_track() runs in worker threads.
+        self.save_lock: threading.Lock = threading.Lock() # Keeps two flushes from writing the temporary file at once.
+        self.dirty: bool = False # Set by put(), the file is behind the cache until the next flush().
+
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, "r") as f:
+                content = json.load(f)
+
+            self.videos = content.get("videos", {})
+        except (OSError, json.JSONDecodeError, AttributeError):
+            logging.error(f"Failed to read extraction cache in function load(), starting with an empty cache; {traceback.format_exc()}")
+            self.videos = {}
+
+    def flush(self) -> None:
+        """ Saves the cache if it changed since the last flush. The entries are copied under the lock and written outside of it,
+        so lookups aren't blocked by the write. Entries are never modified in place, a shallow copy is enough. """
+
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                videos = self.videos.copy()
+                self.dirty = False
+
+            if not self.save(videos):
+                with self.lock:
+                    self.dirty = True # Try again on the next flush.
+
+    def save(self, videos: dict[str, dict]) -> bool:
+        """ Writes the cache to a temporary file first, so that a crash mid-write can't corrupt it. """
+
+        temp_path = self.file_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({"videos": videos}, f)
+            os.replace(temp_path, self.file_path)
+        except OSError:
+            logging.error(f"Failed to write extraction cache in function save(); {traceback.format_exc()}")
+            return False
+
+        return True
+
+    def is_fresh(self, entry: dict) -> bool:
+        """ An entry is fresh if its stream URL won't expire within expiry_margin seconds. """
+
+        return entry["expire"] == 0 or entry["expire"] - self.expiry_margin > time.time()
+
+    def get(self, video_id: str) -> dict | None:
+        with self.lock:
+            entry = self.videos.get(video_id)
+            if entry is None or not self.is_fresh(entry):
+                return None
+
+            self.videos[video_id] = self.videos.pop(video_id) # Move to the end so the least recently used entries get evicted first.
+            return entry.copy()
+
+    def put(self, info: dict) -> None:
+        entry = trim_info(info)
+        if not entry["id"]:
+            return
+
+        with self.lock:
+            self.videos.pop(entry["id"], None)
+            self.videos[entry["id"]] = entry
+
+            while len(self.videos) > self.max_entries:
+                oldest = next(iter(self.videos))
+                del self.videos[oldest]
+
+            self.dirty = True
+
+class SearchCache:
+    """ LRU map from normalized search queries to video IDs.
+    Entries expire after ttl seconds, since search results change over time. Searches that returned
+    nothing are cached as "no_entry" for negative_ttl seconds so repeated typos don't reach the extractor.
+    With a file_path the map survives restarts: updates mark it dirty and flush() saves it, like ExtractionCache. """
+
+    def __init__(self, max_entries: int, ttl: int, negative_ttl: int, file_path: str | None=None) -> None:
+        self.max_entries: int = max_entries
+        self.ttl: int = ttl
+        self.negative_ttl: int = negative_ttl
+        self.file_path: str | None = file_path # None keeps the cache in memory only.
+        self.entries: OrderedDict[str, tuple[str, float]] = OrderedDict() # query -> (video ID or "no_entry", expiry time as a unix timestamp)
+        self.lock: threading.Lock = threading.Lock()
+        self.save_lock: threading.Lock = threading.Lock() # Keeps two flushes from writing the temporary file at once.
+        self.dirty: bool = False
+
+        self.load()
+
+    def load(self) -> None:
+        if self.file_path is None or not os.path.exists(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, "r") as f:
+                content = json.load(f)
+
+            now = time.time()
+            for query, (value, expiry) in content.get("queries", {}).items(): # Saved least recently used first.
+                if expiry >= now:
+                    self.entries[query] = (value, expiry)
+        except (OSError, json.JSONDecodeError, AttributeError, TypeError, ValueError):
+            logging.error(f"Failed to read search cache in function load(), starting with an empty cache; {traceback.format_exc()}")
+            self.entries.clear()
+
+    def flush(self) -> None:
+        """ Saves the cache if it changed since the last flush, the entries are copied under the lock and written outside of it. """
+
+        if self.file_path is None:
+            return
+
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                queries = dict(self.entries)
+                self.dirty = False
+
+            temp_path = self.file_path + ".tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump({"queries": queries}, f)
+                os.replace(temp_path, self.file_path)
+            except OSError:
+                logging.error(f"Failed to write search cache in function flush(); {traceback.format_exc()}")
+                with self.lock:
+                    self.dirty = True # Try again on the next flush.
+
+    def get(self, query: str) -> str | None:
+        """ Returns the cached video ID, "no_entry" if the search is known to have no results, None on a miss. """
+
+        key = normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] < time.time():
+                del self.entries[key]
+                self.dirty = True
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, query: str, video_id: str | None) -> None:
+        """ Pass None as video_id to cache a search without results. """
+
+        key = normalize_query(query)
+        if video_id is None:
+            value, expiry = "no_entry", time.time() + self.negative_ttl
+        else:
+            value, expiry = video_id, time.time() + self.ttl
+
+        with self.lock:
+            self.entries[key] = (value, expiry)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            self.dirty = True
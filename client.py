@@ -24,8 +24,49 @@ BOT_TOKEN_FILE_NAME: str = "bot_token.txt" # What filename the bot should look f
 DIR: str = os.path.dirname(__file__)
 LOG_FILENAME: str = "bot.log" # File where errors and warnings will be written to.
 REQUIRED_ROLE_NAME: str | None = None # Used to check if a user has a specific role before allowing music commands execution. None or empty string means checks will be ignored.
-YDL_OPTIONS: dict = {"format": "bestaudio", "noplaylist": True, "quiet": True}
+YDL_OPTIONS: dict = {"format": "bestaudio[acodec=opus]/bestaudio", "noplaylist": True, "quiet": True} # Opus formats are preferred since they can be sent to Discord without re-encoding.
+YDL_PLAYLIST_OPTIONS: dict = {"extract_flat": "in_playlist", "playlistend": 100, "quiet": True} # Used for playlist and mix URLs, lists every entry without extracting each video. playlistend matches the queue limit.
+EXTRACTOR_BACKEND: str = "yt_dlp" # "yt_dlp" to extract from YouTube, "fake" returns canned tracks without network access (for testing).
+YDL_POOL_SIZE: int = 4 # Amount of YoutubeDL instances kept alive for extractions, should be at least MAX_CONCURRENT_EXTRACTIONS.
+YDL_POOL_MAX_USES: int = 200 # YoutubeDL instances are rebuilt after this many extractions.
 PLAYLIST_FILENAME: str = "playlists.json"
+EXTRACTION_CACHE_FILENAME: str = "extraction_cache.json" # File where resolved track information is cached between restarts.
+HISTORY_FILENAME: str = "history.jsonl" # File every played track is appended to, so the history survives restarts.
+HISTORY_MAX_ENTRIES: int = 500 # Amount of played tracks kept in the history, older ones are dropped first.
+HISTORY_PAGE_SIZE: int = 15 # Tracks shown per page of the history command.
+EXTRACTION_CACHE_MAX_ENTRIES: int = 1000 # Maximum amount of tracks kept in the extraction cache, least recently used ones are dropped first.
+SEARCH_CACHE_FILENAME: str = "search_cache.json" # File where search queries and the videos they resolved to are kept between restarts.
+SEARCH_CACHE_MAX_ENTRIES: int = 500 # Maximum amount of search queries remembered.
+SEARCH_CACHE_TTL: int = 86400 # Seconds a search query keeps resolving to the same video before it's searched again.
+SEARCH_CACHE_NEGATIVE_TTL: int = 300 # Seconds a search without results is remembered, avoids searching the same typo repeatedly.
+MAX_CONCURRENT_EXTRACTIONS: int = 4 # Maximum amount of queries resolved at the same time when adding multiple tracks.
+ADD_PROGRESS_INTERVAL: float = 2.0 # Minimum seconds between edits of the progress message while adding tracks.
+PREFETCH_COUNT: int = 3 # Amount of upcoming queue entries whose stream URLs are resolved in the background while a track plays.
+GAPLESS_PLAYBACK: bool = True # Prepare the next track's audio source before the current one ends, removing the silence between tracks.
+GAPLESS_PRELOAD_SECONDS: int = 15 # How many seconds before the end of a track the next one is prepared.
+STREAM_EXPIRY_MARGIN: int = 600 # Seconds before a cached stream URL expires at which it's considered stale and gets extracted again.
+STREAM_REFRESH_INTERVAL: int = 300 # Seconds between background checks for stream URLs close to expiry.
+OPUS_PASSTHROUGH: bool = True # Copy 48 kHz Opus streams to Discord as they are instead of decoding and re-encoding them. Ignored when audio filters are applied.
+CHANNEL_BITRATE_FORMATS: bool = True # Stream the lowest-bitrate format that still fills the voice channel's bitrate and cap the Opus encoder at it. Playback is re-tuned when the channel's bitrate changes.
+SHUFFLE_WEIGHTING: str = "none" # How random mode picks the next track: "none" gives every queued track the same chance, "requester" picks a requester first so everyone's tracks come up equally often.
+WEBM_DEMUXER: bool = True # Demux passthrough Opus streams in Python and send their packets to Discord directly, without an FFmpeg process. Falls back to FFmpeg for streams it can't read.
+STREAM_BUFFER: bool = True # Download the playing track to a temporary file so seek, rewind and forward don't reconnect to YouTube.
+STREAM_BUFFER_MAX_BYTES: int = 200 * 1024 * 1024 # Tracks larger than this aren't buffered, seeking in them uses ranged requests on the stream instead.
+AUDIO_CACHE: bool = True # Keep fully buffered tracks on disk so replays don't stream them again. Requires STREAM_BUFFER.
+AUDIO_CACHE_DIRECTORY: str = "audio_cache" # Directory where cached audio files are stored.
+AUDIO_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024 # Total size of the audio cache, the least recently played files are deleted first.
+LOUDNESS_NORMALIZATION: bool = True # Measure each track's loudness once and play it back with a static gain so all tracks sound equally loud.
+LOUDNESS_FILENAME: str = "loudness.json" # File where loudness measurements are stored by video ID.
+LOUDNESS_TARGET: float = -14.0 # Target integrated loudness in LUFS.
+LOUDNESS_MAX_GAIN: float = 10.0 # Maximum boost in dB applied to quiet tracks.
+LOUDNESS_MIN_GAIN: float = 1.0 # Tracks within this many dB of the target are played unchanged, so Opus passthrough still applies to them.
+SHARED_SOURCES: bool = True # Voice sessions playing the same track from the same position share a single FFmpeg process.
+SHARED_SOURCE_JOIN_WINDOW: int = 10 # Seconds into a shared track during which other sessions can still join it, its frames are kept in memory until then.
+SHARED_SOURCE_LINGER: int = 30 # Seconds a shared track still within its join window is kept after its last listener leaves, a restart within this time doesn't start FFmpeg again.
+SUPERVISOR_INTERVAL: int = 10 # Seconds between resource samples of FFmpeg processes and checks for orphaned ones.
+SUPERVISOR_GRACE_PERIOD: int = 10 # Seconds an FFmpeg process may exist without being played before it's considered orphaned.
+PROBE_TIMEOUT: int = 20 # Seconds after which a hanging ffprobe process is killed.
+STREAM_FAILURE_SLACK: int = 10 # A track that stops more than this many seconds before its end is considered a failed stream and is retried once with a new URL.
 token: str = get_token(BOT_TOKEN_FILE_NAME) # Actual token string, the function will return a string from the file BOT_TOKEN_FILE_NAME in DIR.
 
 client: commands.Bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, activity=activity)
\ No newline at end of file
@@ -0,0 +1,104 @@
+import time
+import random
+import hashlib
+from abc import ABC, abstractmethod
+from ydlpool import YDLPool
+
+""" Extractor backends used by the Resolver.
+The yt_dlp backend is used by the bot, the fake backend returns canned information
+without touching the network and is used to benchmark the resolution path. """
+
+class ExtractionError(Exception):
+    """ Raised by FakeExtractor to simulate a failed extraction. """
+
+class Extractor(ABC):
+    """ Interface of an extractor backend. extract() takes the same queries as YoutubeDL.extract_info()
+    (a URL or "ytsearch:<query>") and returns an info dictionary with the same structure, or None. """
+
+    @abstractmethod
+    def extract(self, query: str, flat: bool=False) -> dict | None:
+        """ flat=True lists a playlist's entries without extracting each video. """
+
+    def close(self) -> None:
+        pass
+
+class YTDLExtractor(Extractor):
+    """ Extracts with pooled YoutubeDL instances, one pool for single tracks and one for flat playlist extraction. """
+
+    def __init__(self, options: dict, playlist_options: dict, pool_size: int, max_uses: int) -> None:
+        self.pool: YDLPool = YDLPool(options, pool_size, max_uses)
+        self.playlist_pool: YDLPool = YDLPool(playlist_options, 1, max_uses)
+
+    def extract(self, query: str, flat: bool=False) -> dict | None:
+        with (self.playlist_pool if flat else self.pool).checkout() as yt:
+            return yt.extract_info(query, download=False)
+
+    def close(self) -> None:
+        self.pool.close()
+        self.playlist_pool.close()
+
+class FakeExtractor(Extractor):
+    """ Offline stand-in for YTDLExtractor. Every call sleeps for latency ± jitter seconds and fails with
+    probability failure_rate. Search queries containing "no_entry" return no results.
+    Returned information is derived from the query, so the same query always returns the same track. """
+
+    def __init__(self, latency: float=0.5, jitter: float=0.0, failure_rate: float=0.0, playlist_size: int=50, seed: int | None=None) -> None:
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.failure_rate: float = failure_rate
+        self.playlist_size: int = playlist_size
+        self.random: random.Random = random.Random(seed)
+        self.calls: int = 0
+
+    def get_fake_id(self, text: str) -> str:
+        return hashlib.sha1(text.encode()).hexdigest()[:11]
+
+    def get_video_info(self, video_id: str) -> dict:
+        duration = 120 + int(video_id[:4], 16) % 480
+        return {
+            "id": video_id,
+            "title": f"Fake track {video_id}",
+            "duration": duration,
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+            "url": f"https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&expire={int(time.time()) + 21600}",
+            "acodec": "opus",
+            "ext": "webm",
+            "abr": 128.0,
+            "asr": 48000,
+            "uploader": "Fake uploader",
+            "like_count": 0,
+            "view_count": 0,
+            "upload_date": "20240101",
+            "description": "Returned by FakeExtractor."
+        }
+
+    def extract(self, query: str, flat: bool=False) -> dict | None:
+        self.calls += 1
+        time.sleep(max(self.latency + self.random.uniform(-self.jitter, self.jitter), 0))
+
+        if self.random.random() < self.failure_rate:
+            raise ExtractionError(f"Simulated extraction failure for query \"{query}\"")
+
+        if query.startswith("ytsearch:"):
+            if "no_entry" in query:
+                return {"entries": []}
+            return {"entries": [self.get_video_info(self.get_fake_id(query))]}
+
+        if flat:
+            playlist_id = self.get_fake_id(query)
+            return {"entries": [
+                {"id": self.get_fake_id(f"{playlist_id}{i}"), "title": f"Fake playlist track {i}", "duration": 180, "thumbnails": []}
+                for i in range(self.playlist_size)
+            ]}
+
+        video_id = query.split("v=")[-1][:11] if "v=" in query else self.get_fake_id(query)
+        return self.get_video_info(video_id)
+
+def create_extractor(backend: str, options: dict, playlist_options: dict, pool_size: int, max_uses: int) -> Extractor:
+    """ Returns the extractor for EXTRACTOR_BACKEND in client.py, "yt_dlp" or "fake". """
+
+    if backend == "fake":
+        return FakeExtractor()
+
+    return YTDLExtractor(options, playlist_options, pool_size, max_uses)
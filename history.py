@@ -0,0 +1,101 @@
+import os
+import json
+import logging
+import traceback
+from itertools import islice
+from collections import OrderedDict
+
+""" Play history.
+The last max_entries tracks that started playing, newest first. Entries live in an ordered dict keyed by video ID, oldest first,
+so the duplicate check is constant time. A replayed track is moved to the end instead of being added again, and the oldest entry
+is dropped once the history is full. Every play is appended to a json lines file, the file is rewritten with only the live entries
+once it holds twice as many lines as the history. """
+
+class PlayHistory:
+    """ Bounded, ordered map of played tracks, persisted to an append-only file. """
+
+    def __init__(self, file_path: str, max_entries: int) -> None:
+        self.file_path: str = file_path
+        self.max_entries: int = max_entries
+        self.entries: OrderedDict[str, dict] = OrderedDict() # video ID -> entry, least recently played first.
+        self.file_lines: int = 0 # Lines in the file, compact() runs when they reach twice max_entries.
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.entries
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+
+        damaged = False
+        try:
+            with open(self.file_path, "r") as f:
+                for line in f:
+                    self.file_lines += 1
+                    try:
+                        self.insert(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        damaged = True # A line cut off by a crash mid-write, the rest of the file is still valid.
+        except OSError:
+            logging.error(f"Failed to read history file in function load(), starting with an empty history; {traceback.format_exc()}")
+
+        if damaged or self.file_lines >= 2 * self.max_entries: # Rewriting also drops a cut off last line, the next append would continue it.
+            self.compact()
+
+    def insert(self, entry: dict) -> None:
+        self.entries[entry["id"]] = entry
+        self.entries.move_to_end(entry["id"]) # A replayed track keeps a single entry, now the most recent one.
+
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def record(self, video_id: str, title: str, webpage: str, requester: int | None, timestamp: int) -> None:
+        """ Adds a played track to the front of the history and appends it to the file. """
+
+        entry = {"id": video_id, "title": title, "webpage": webpage, "requester": requester, "time": timestamp}
+        self.insert(entry)
+
+        try:
+            with open(self.file_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.file_lines += 1
+        except OSError:
+            logging.error(f"Failed to append to history file in function record(); {traceback.format_exc()}")
+
+        if self.file_lines >= 2 * self.max_entries:
+            self.compact()
+
+    def compact(self) -> None:
+        """ Rewrites the file with the live entries, oldest first. Written to a temporary file first, so that a crash mid-write can't corrupt it. """
+
+        temp_path = self.file_path + ".tmp"
+        entries = list(self.entries.values())
+        try:
+            with open(temp_path, "w") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in entries)
+            os.replace(temp_path, self.file_path)
+            self.file_lines = len(entries)
+        except OSError:
+            logging.error(f"Failed to compact history file in function compact(); {traceback.format_exc()}")
+
+    def clear(self) -> None:
+        """ Empties the history and its file, called by the clear command. """
+
+        self.entries.clear()
+
+        try:
+            open(self.file_path, "w").close()
+            self.file_lines = 0
+        except OSError:
+            logging.error(f"Failed to clear history file in function clear(); {traceback.format_exc()}")
+
+    def get_entries(self, start: int=0, amount: int | None=None) -> list[dict]:
+        """ Returns amount entries (all by default) starting at the start-th most recent one. """
+
+        stop = None if amount is None else start + amount
+        return list(islice(reversed(self.entries.values()), start, stop))
@@ -0,0 +1,128 @@
+import os
+import re
+import json
+import logging
+import threading
+import traceback
+import shutil
+
+from supervisor import ProcessSupervisor
+
+""" Loudness analysis for volume normalization.
+Each track is measured once with ffmpeg's loudnorm filter (EBU R128) from its local copy, and the result is stored by video ID.
+Playback then only needs a static volume filter instead of running loudnorm live on every stream. """
+
+LOUDNORM_JSON_PATTERN = re.compile(r'\{[^{}]*"input_i"[^{}]*\}') # loudnorm prints its measurements as a JSON object at the end of stderr.
+ANALYSIS_TIMEOUT = 300
+
+class LoudnessStore:
+    """ Integrated loudness (LUFS) and true peak (dBTP) of analyzed tracks keyed by video ID, saved to a json file on every update. """
+
+    def __init__(self, file_path: str, target: float, max_gain: float, min_gain: float, supervisor: ProcessSupervisor) -> None:
+        self.file_path: str = file_path
+        self.target: float = target # Integrated loudness every track is brought to, in LUFS.
+        self.max_gain: float = max_gain # Maximum boost in dB, quiet tracks would otherwise amplify their noise floor.
+        self.min_gain: float = min_gain # Gains smaller than this are skipped, applying any gain means the stream has to be transcoded.
+        self.supervisor: ProcessSupervisor = supervisor # Analysis processes are registered like the playback ones.
+        self.tracks: dict[str, dict] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.analysis_lock: threading.Lock = threading.Lock() # One analysis at a time, each one decodes a whole track.
+
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+
+        try:
+            with open(self.file_path, "r") as f:
+                self.tracks = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            logging.error(f"Failed to read loudness file in function load(), starting without measurements; {traceback.format_exc()}")
+            self.tracks = {}
+
+    def save(self) -> None:
+        temp_path = self.file_path + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.tracks, f)
+            os.replace(temp_path, self.file_path)
+        except OSError:
+            logging.error(f"Failed to write loudness file in function save(); {traceback.format_exc()}")
+
+    def contains(self, video_id: str) -> bool:
+        with self.lock:
+            return video_id in self.tracks
+
+    def get_gain(self, video_id: str) -> float | None:
+        """ Returns the gain in dB that brings a track to the target loudness without clipping, None if the track hasn't been
+        analyzed or the gain is too small to be worth transcoding for. """
+
+        with self.lock:
+            measurement = self.tracks.get(video_id)
+        if measurement is None:
+            return None
+
+        gain = min(self.target - measurement["integrated"], self.max_gain, -1.0 - measurement["peak"]) # Keep the true peak under -1 dBTP.
+        if abs(gain) < self.min_gain:
+            return None
+
+        return round(gain, 1)
+
+    def take_snapshot(self, file_path: str) -> str | None:
+        """ Returns a path to a copy of file_path that's owned by the analysis, a hard link if possible. None if it couldn't be made. """
+
+        snapshot_path = file_path + ".analysis"
+        try:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+            try:
+                os.link(file_path, snapshot_path)
+            except OSError: # Hard links aren't supported on every file system.
+                shutil.copyfile(file_path, snapshot_path)
+        except OSError:
+            logging.error(f"Failed to copy \"{file_path}\" for analysis in function take_snapshot(); {traceback.format_exc()}")
+            return None
+
+        return snapshot_path
+
+    def analyze(self, video_id: str, file_path: str, remove: bool=False) -> None:
+        """ Measures a local audio file and stores the result. Blocking, run it in a worker thread.
+        With remove, file_path is a snapshot from take_snapshot() and is deleted afterwards. """
+
+        try:
+            self.measure(video_id, file_path)
+        finally:
+            if remove:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+    def measure(self, video_id: str, file_path: str) -> None:
+        with self.analysis_lock:
+            if self.contains(video_id):
+                return
+
+            try:
+                output = self.supervisor.run(
+                    ["ffmpeg", "-hide_banner", "-nostats", "-i", file_path, "-vn", "-af", "loudnorm=print_format=json", "-f", "null", "-"],
+                    ANALYSIS_TIMEOUT
+                )
+                match = LOUDNORM_JSON_PATTERN.search(output.decode(errors="ignore"))
+                if match is None:
+                    logging.warning(f"No loudness measurement found for \"{video_id}\" in function measure().")
+                    return
+
+                result = json.loads(match.group(0))
+                integrated, peak = float(result["input_i"]), float(result["input_tp"])
+            except Exception:
+                logging.error(f"An error occured while analyzing loudness of \"{video_id}\" in function measure(); {traceback.format_exc()}")
+                return
+
+            if integrated == float("-inf"): # Silence, no gain makes sense.
+                return
+
+            with self.lock:
+                self.tracks[video_id] = {"integrated": integrated, "peak": peak}
+                self.save()
@@ -2,10 +2,22 @@ import discord
 import discord.context_managers
 from discord.interactions import Interaction
 from discord.ext import commands
-from client import client, activity, statuses, COMMAND_PREFIX, REQUIRED_ROLE_NAME, YDL_OPTIONS, PLAYLIST_FILENAME
+from client import client, activity, statuses, COMMAND_PREFIX, REQUIRED_ROLE_NAME, YDL_OPTIONS, YDL_PLAYLIST_OPTIONS, PLAYLIST_FILENAME, EXTRACTION_CACHE_FILENAME, EXTRACTION_CACHE_MAX_ENTRIES, STREAM_EXPIRY_MARGIN, SEARCH_CACHE_FILENAME, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL, SEARCH_CACHE_NEGATIVE_TTL, MAX_CONCURRENT_EXTRACTIONS, ADD_PROGRESS_INTERVAL, EXTRACTOR_BACKEND, YDL_POOL_SIZE, YDL_POOL_MAX_USES, PREFETCH_COUNT, GAPLESS_PLAYBACK, GAPLESS_PRELOAD_SECONDS, STREAM_REFRESH_INTERVAL, STREAM_FAILURE_SLACK, OPUS_PASSTHROUGH, STREAM_BUFFER, STREAM_BUFFER_MAX_BYTES, AUDIO_CACHE, AUDIO_CACHE_DIRECTORY, AUDIO_CACHE_MAX_BYTES, SUPERVISOR_INTERVAL, SUPERVISOR_GRACE_PERIOD, PROBE_TIMEOUT, LOUDNESS_NORMALIZATION, LOUDNESS_FILENAME, LOUDNESS_TARGET, LOUDNESS_MAX_GAIN, LOUDNESS_MIN_GAIN, SHARED_SOURCES, SHARED_SOURCE_JOIN_WINDOW, SHARED_SOURCE_LINGER, WEBM_DEMUXER, CHANNEL_BITRATE_FORMATS, SHUFFLE_WEIGHTING, HISTORY_FILENAME, HISTORY_MAX_ENTRIES, HISTORY_PAGE_SIZE
+from cache import ExtractionCache, SearchCache, get_audio_formats, get_stream_expiry, get_video_id
+from audiocache import AudioCache
+from extractor import Extractor, create_extractor
+from resolver import Resolver, get_query_type
+from streambuffer import StreamBuffer, BufferedOpusAudio
+from supervisor import ProcessSupervisor
+from loudness import LoudnessStore
+from sharedsource import SharedAudioSource, SharedSourceRegistry
+from webmsource import ConnectionPool, DemuxError, WebMOpusSource
+from positionsource import PositionTrackingSource
+from tracks import Track, TrackQueue, normalize_title
+from titleindex import TitleIndex
+from history import PlayHistory
 from datetime import datetime
 import asyncio
-from yt_dlp import YoutubeDL
 import time
 import random
 import re
@@ -13,6 +25,8 @@ import json
 import os
 import logging
 import traceback
+from itertools import islice
+from typing import Callable
 
 """ Generic Functions used for multiple purposes """
 
@@ -29,6 +43,10 @@ def get_seconds(minutes: str) -> int:
     
     return seconds
 
+""" Returns True if url is a local file (audio cache) rather than a stream URL """
+def is_local(url: str) -> bool:
+    return not url.startswith(("http://", "https://"))
+
 class Mixer(commands.Cog):
     """ Class containing commands for the music bot """
     
@@ -39,42 +57,60 @@ class Mixer(commands.Cog):
         self.is_modifying_playlist: bool = False
         self.voice_client: discord.VoiceChannel = None
         self.current_track: str = None
-        self.start_time: int = 0
         self.track_duration: int = 0
         self.last_elapsed_time: int = 0
+        self.tracked_source: PositionTrackingSource | None = None
         self.is_looping: bool = False
         self.is_random: bool = False
-        self.track_to_loop: tuple = None
+        self.track_to_loop: Track | None = None
         self.webpage: str = None
-        self.queue: list[tuple[str, str, int, str, str]] = []
-        self.queue_history: list[tuple[str]] = []
-        self.queue_to_loop: list[tuple[str, str, int, str, str]] = []
+        self.queue: TrackQueue = TrackQueue() # Tracks have no stream URL, it's resolved just before a track plays.
+        self.queue_history: PlayHistory = PlayHistory(HISTORY_FILENAME, HISTORY_MAX_ENTRIES) # Played tracks, kept across resets and restarts. Cleared by the clear command.
+        self.queue_to_loop: TrackQueue = TrackQueue()
         self.data: dict = {}
         self.source: str = None
         self.after: bool = True # Variable to stop the bot from skipping tracks infinitely until the queue ends.
         self.is_looping_queue: bool = False
+        self.is_skipping: bool = False # Set by skip() so play_next() doesn't mistake a skipped track for a failed stream.
+        self.stream_retried: bool = False # A failed stream is only retried once per track.
         self.file_lock: asyncio.Lock = asyncio.Lock() # Used to keep only 1 write request to playlists.json instead of multiple at the same time.
+        self.playlist_indexes: dict[int, tuple[int | None, TitleIndex]] = {} # Guild ID -> (playlists.json modification time, title index of the guild's playlist)
+        self.prefetch_task: asyncio.Task | None = None
+        self.refresh_task: asyncio.Task | None = None
+        self.preload_task: asyncio.Task | None = None
+        self.preloaded: tuple[Track, dict, discord.AudioSource, StreamBuffer | None] | None = None # (queue entry, stream information, audio source, stream buffer the source reads) of the track prepared for gapless playback.
+        self.stream_buffer: StreamBuffer | None = None # Local copy of the current track, used for seeking.
+        self.channel_bitrate: int | None = None # Bitrate of the voice channel in bits per second, picks the stream format and caps the encoder.
+        self.playback_ctx: commands.Context | None = None # Context of the last play_track() call, lets channel events restart playback.
+        self.supervisor: ProcessSupervisor = ProcessSupervisor(SUPERVISOR_GRACE_PERIOD, PROBE_TIMEOUT) # Every FFmpeg and ffprobe process started for playback is registered here.
+        self.supervisor_task: asyncio.Task | None = None
+        self.shared_sources: SharedSourceRegistry = SharedSourceRegistry(SHARED_SOURCE_JOIN_WINDOW, SHARED_SOURCE_LINGER) # FFmpeg sources shared between voice sessions playing the same track.
+        self.connection_pool: ConnectionPool = ConnectionPool() # Keep-alive connections used by WebMOpusSource.
+        self.loudness: LoudnessStore | None = LoudnessStore(LOUDNESS_FILENAME, LOUDNESS_TARGET, LOUDNESS_MAX_GAIN, LOUDNESS_MIN_GAIN, self.supervisor) if LOUDNESS_NORMALIZATION else None # Loudness measurements by video ID, kept across resets and restarts.
+        self.audio_cache: AudioCache | None = AudioCache(AUDIO_CACHE_DIRECTORY, AUDIO_CACHE_MAX_BYTES) if AUDIO_CACHE and STREAM_BUFFER else None # Fully buffered tracks, kept across resets and restarts.
+        self.extraction_cache: ExtractionCache = ExtractionCache(EXTRACTION_CACHE_FILENAME, EXTRACTION_CACHE_MAX_ENTRIES, STREAM_EXPIRY_MARGIN) # Kept across resets and restarts.
+        self.search_cache: SearchCache = SearchCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL, SEARCH_CACHE_NEGATIVE_TTL, SEARCH_CACHE_FILENAME) # Maps search queries to video IDs, shared by every command that searches. Kept across resets and restarts.
+        self.extractor: Extractor = create_extractor(EXTRACTOR_BACKEND, YDL_OPTIONS, YDL_PLAYLIST_OPTIONS, YDL_POOL_SIZE, YDL_POOL_MAX_USES) # Backend used for every extraction, see EXTRACTOR_BACKEND.
+        self.resolver: Resolver = Resolver(self.extractor, self.extraction_cache, self.search_cache, MAX_CONCURRENT_EXTRACTIONS) # Does the actual work behind fetch_track() and resolve_queries().
     
     """ Define helper functions """
 
+    def get_position(self) -> float:
+        """ Returns the position of the current track in seconds, counted from the frames the voice client has played. """
+
+        if self.tracked_source is None:
+            return self.last_elapsed_time
+        return self.tracked_source.get_position()
+
     def get_query_type(self, query: str) -> str: # Returns "std_query" if the query pattern does not match a youtube url's
-        youtube_url_pattern = re.compile(r'(https?://)?(www\.)?(youtube\.com|youtu\.be)/(watch|playlist\?v|list=|embed/|v/|.+\?v=)?([^&=%\?]{11})') # YouTube url pattern
-        
-        if youtube_url_pattern.match(query):
-            return "url"
-        return "std_query"
+        return get_query_type(query)
 
-    def get_tracks(self, queue: list) -> str: # Joins all tracks in a single string from queue.
+    def get_tracks(self, queue: TrackQueue | list) -> str: # Joins all tracks in a single string from queue.
         tracks = []
 
-        try:
-            for (url, title, duration, thumbnail_url, webpage) in queue:
-                title = title.strip()
-                tracks.append(title)
-        except ValueError: # Switch to playlist parsing
-            for (title, url) in queue:
-                title = title.strip()
-                tracks.append(title)
+        for track in queue:
+            title = track.title if isinstance(track, Track) else track[0] # Playlist entries are (title, url) pairs.
+            tracks.append(title.strip())
 
         queue_str = ", ".join(tracks)
 
@@ -91,22 +127,21 @@ class Mixer(commands.Cog):
 
         return queue_str
     
-    def shuffle_queue(self, queue: list) -> list:
-        random.shuffle(queue)
+    def shuffle_queue(self, queue: TrackQueue | list) -> TrackQueue | list:
+        tracks = list(queue)
+        random.shuffle(tracks)
 
-        return queue
+        return TrackQueue(tracks) if isinstance(queue, TrackQueue) else tracks
 
     """ Removes duplicates from a queue by creating a set and a new list
     and only appending items not in seen to it. """
 
-    def remove_duplicates(self, queue: list[tuple[str, str, int, str, str]]) -> list:
+    def remove_duplicates(self, queue: TrackQueue) -> TrackQueue:
         seen = set()
-        unique = []
+        unique = TrackQueue()
         for track in queue:
-            title = track[1]
-            
-            if title not in seen:
-                seen.add(title)
+            if track.title not in seen:
+                seen.add(track.title)
                 unique.append(track)
 
         return unique
@@ -130,7 +165,7 @@ class Mixer(commands.Cog):
         
         return False
 
-    async def reposition_track(self, ctx: commands.Context, queue: list, track: str, position: int) -> None:
+    async def reposition_track(self, ctx: commands.Context, queue: TrackQueue | list, track: str, position: int) -> None:
         """ Function to reposition a track from origin index to a new user-specified index. """
         
         embed = discord.Embed(
@@ -139,41 +174,33 @@ class Mixer(commands.Cog):
             timestamp=datetime.now()
         )
 
-        found = False
-        is_playlist = False
-        try:
-            for index, (url, title, duration, thumbnail_url, webpage) in enumerate(queue):
-                if track.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                    if index == position:
-                        await ctx.send("Cannot reposition a track to the same index.")
-                        return
-                    
-                    track_info = queue.pop(index)
-                    queue.insert(position, track_info)
-                    
-                    if track_info in self.queue_to_loop:
-                        self.queue_to_loop.remove(track_info)
-                        self.queue_to_loop.insert(position, track_info)
-                    found = True
-                    break
-        except ValueError:
-            is_playlist = True
-            for index, (title, url) in enumerate(queue):
-                if track.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                    if index == position:
-                        await ctx.send("Cannot reposition a track to the same index.")
-                        return
-                    
-                    track_info = queue.pop(index)
-                    queue.insert(position, track_info)
+        is_playlist = not isinstance(queue, TrackQueue)
+        if not is_playlist:
+            index, track_info = queue.find(track)
+        else:
+            index = min(self.get_playlist_index(ctx.guild.id, queue).search(normalize_title(track)), default=None)
+            track_info = queue[index] if index is not None else None
 
-                    found = True
-                    break
+        found = track_info is not None
+        if not found:
+            await ctx.send(f"Track **{track}** not found in queue.")
+            return
+
+        if index == position:
+            await ctx.send("Cannot reposition a track to the same index.")
+            return
+
+        if not is_playlist:
+            queue.move(index, position)
+            if track_info in self.queue_to_loop: # The same entry, queue_to_loop holds the Track objects of the queue.
+                self.queue_to_loop.move(self.queue_to_loop.index(track_info), position)
+        else:
+            queue.insert(position, queue.pop(index))
         
         old_track_index = index + 1
         new_track_index = position + 1
 
-        embed.add_field(name="Repositioned Track", value=track_info[1], inline=False) if not is_playlist else embed.add_field(
+        embed.add_field(name="Repositioned Track", value=track_info.title, inline=False) if not is_playlist else embed.add_field(
             name="Repositioned track", value=track_info[0], inline=False
         )
         embed.add_field(name="Old index", value=old_track_index, inline=True)
@@ -183,46 +210,40 @@ class Mixer(commands.Cog):
         except ValueError:
             embed.add_field(name="New playlist", value=self.get_playlist_tracks(queue), inline=False)
         
-        if found:
-            await ctx.send(embed=embed)
-        else:
-            await ctx.send(f"Track **{track}** not found in queue.")
+        await ctx.send(embed=embed)
 
-    async def remove_track(self, ctx: commands.Context, queue: list[tuple[str, str]] | list[tuple[str, str, int, str, str]], *track_names: str) -> None:
+    async def remove_track(self, ctx: commands.Context, queue: TrackQueue | list[tuple[str, str]], *track_names: str) -> None:
         """ Function to remove a set of tracks from self.queue """
         
         removed_tracks = []
         tracks_not_found = []
-        try:
+        if isinstance(queue, TrackQueue):
             for track_name in track_names:
-                found = False
-                for i, (url, title, duration, thumbnail_url, webpage) in enumerate(queue):
-                    if track_name.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                        removed_track = queue.pop(i)
-                        removed_tracks.append(removed_track[1])
-
-                        if removed_track in self.queue_to_loop:
-                            self.queue_to_loop.remove(removed_track) # Also remove the same track from the loop queue.
-                        found = True
-                        break
-
-                if not found:
+                i, removed_track = queue.find(track_name)
+                if removed_track is None:
                     if track_name not in tracks_not_found:
                         tracks_not_found.append(track_name)
-        except ValueError:
+                    continue
+
+                queue.pop(i)
+                removed_tracks.append(removed_track.title)
+                if removed_track in self.queue_to_loop:
+                    self.queue_to_loop.remove(removed_track) # Also remove the same track from the loop queue.
+        else:
+            playlist_index = self.get_playlist_index(ctx.guild.id, queue)
+            removed_positions = set() # Positions in the unchanged playlist, the index is keyed by them.
             for track_name in track_names:
-                found = False
-                for i, (title, url) in enumerate(queue):
-                    if track_name.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                        removed_track = queue.pop(i)
-                        removed_tracks.append(removed_track[0])
-
-                        found = True
-                        break
-                
-                if not found:
+                i = min(playlist_index.search(normalize_title(track_name)) - removed_positions, default=None)
+                if i is None:
                     if track_name not in tracks_not_found:
                         tracks_not_found.append(track_name)
+                    continue
+
+                removed_positions.add(i)
+                removed_tracks.append(queue[i][0])
+
+            for i in sorted(removed_positions, reverse=True):
+                queue.pop(i)
 
         embed = discord.Embed(
             colour=discord.Colour.random(seed=random.randint(1, 1000)),
@@ -238,6 +259,23 @@ class Mixer(commands.Cog):
         
         await ctx.send(embed=embed)
 
+    async def cog_load(self) -> None:
+        """ Called by discord.py when the cog is added, starts background tasks that live as long as the cog. """
+
+        self.supervisor_task = asyncio.create_task(self.supervise())
+
+    def cog_unload(self) -> None:
+        """ Called by discord.py when the cog is removed, closes long-lived resources. """
+
+        if self.supervisor_task is not None:
+            self.supervisor_task.cancel()
+        self.extractor.close()
+        self.close_buffer()
+        self.extraction_cache.flush()
+        self.search_cache.flush()
+        if self.audio_cache is not None:
+            self.audio_cache.flush()
+
     """ Function to reset the bot's state to its default __init__ state 
     Called in case of disconnects. """
 
@@ -246,69 +284,549 @@ class Mixer(commands.Cog):
         self.current_track: str = None
         self.is_modifying_queue: bool = False
         self.is_modifying_playlist: bool = False
-        self.start_time: int = 0 # The start time of each track.
         self.track_duration: int = 0
-        self.last_elapsed_time: int = 0 # The time that has elapsed since the track's start time. Updated when paused, rewound or forwarded.
+        self.last_elapsed_time: int = 0 # Position of the current track in seconds, see get_position(). Updated when paused, rewound or forwarded.
+        self.tracked_source: PositionTrackingSource | None = None # Source of the current track as played by the voice client, counts the frames played.
         self.is_looping: bool = False # Simple flag to keep track of the looping state.
         self.is_random: bool = False # Another flag to keep track of the "random" state.
-        self.track_to_loop: tuple = None # Updated every time the bot plays a new track. 
+        self.track_to_loop: Track | None = None # Updated every time the bot plays a new track. 
         self.webpage: str = None # "webpage" refers to the actual youtube webpage url that the bot extracts the source audio from, used mainly for the yoink command.
-        self.queue: list = []
-        self.queue_history: list = [] # Queue history, all played tracks are appended here and can be accessed with the $history command.
-        self.queue_to_loop: list = [] # List where tracks are saved to when queue loop is enabled. Copies self.queue.
+        self.queue: TrackQueue = TrackQueue()
+        self.queue_to_loop: TrackQueue = TrackQueue() # Queue where tracks are saved to when queue loop is enabled. Holds the same Track objects as self.queue, so entries are matched by identity.
         self.data: dict = {} # Data about the currently playing track.
         self.source: str = None # Audio source, which is obtained from the extracted URL.
         self.after: bool = True # Variable to keep "play_next()" from looping infinitely.
         self.is_looping_queue: bool = False
+        self.is_skipping: bool = False
+        self.stream_retried: bool = False
+
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel() # Stop resolving stream URLs for a queue that no longer exists.
+            self.prefetch_task = None
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            self.refresh_task = None
+        self.discard_preload()
+        self.close_buffer()
+        self.playback_ctx = None
 
     """ Call yt_dlp's extract_info() function to get
     the source URL of the audio. """
 
-    def fetch_track(self, ctx: commands.Context, query_type: str, query: str) -> dict | str:
+    def fetch_track(self, ctx: commands.Context, query_type: str, query: str, use_cache: bool=True) -> dict | str:
         """ Fetches a dictionary containing information about the
-        requested query. Returns "no_entry" if no results can be found, "invalid_query" if the query has an invalid structure. """
+        requested query. Returns "no_entry" if no results can be found, "invalid_query" if the query has an invalid structure.
+        Cached tracks are returned without extracting, pass use_cache=False to get the full info dictionary from yt_dlp. """
         
-        with YoutubeDL(YDL_OPTIONS) as yt:
-            if query_type == "std_query":
-                info = yt.extract_info(f"ytsearch:{query}", download=False) # Extract with query
-            elif query_type == "url":
-                info = yt.extract_info(query, download=False) # Extract without query.
-            else:
-                return "invalid_query"
+        return self.resolver.fetch_track(query_type, query, use_cache)
 
-            if not info:
-                return "no_entry"
+    def fetch_playlist(self, ctx: commands.Context, query: str) -> list[dict] | str:
+        """ Lists every track of a playlist or mix URL, see Resolver.fetch_playlist(). """
 
-            if info and "entries" in info:
-                info = info["entries"][0]
+        return self.resolver.fetch_playlist(query)
 
-            return info
+    def start_resolving(self, ctx: commands.Context, queries: tuple[str] | list[str]) -> list[asyncio.Task]:
+        """ Starts resolving multiple queries in parallel, returns one task per query in the same order as the queries. """
 
-    async def play_track(self, ctx: commands.Context, url: str, data: dict, seconds: int=0, mode: str="default"): # mode can be either "rewind" "seek" "forward" or "default"
-        """ Plays the track by launching a FFmpeg process with the FFMPEG_OPTIONS_CUSTOM flags
-        Also updates the data dictionary with new information. """
-        
-        self.last_elapsed_time = int(time.time() - self.start_time) # Update time so it shows correctly in nowplaying / duration
-        
-        """ FFMPEG_OPTIONS_CUSTOM is a dictionary containing all settings that will be passed to
-        ffmpeg. """
+        return self.resolver.start_resolving(queries)
+
+    async def resolve_queries(self, ctx: commands.Context, queries: tuple[str] | list[str]) -> list[dict | list[dict] | str]:
+        """ Resolves multiple queries in parallel and waits for all of them. Results keep the order of the queries. """
+
+        return await self.resolver.resolve_queries(queries)
+
+    def get_stream_info(self, info: dict) -> dict:
+        """ Returns the direct audio URL of a fetched track together with the codec information yt_dlp reported for it.
+        With CHANNEL_BITRATE_FORMATS the lowest-bitrate format of the same codec that still fills the voice channel's bitrate is
+        picked instead of the best one, "reduced" tells whether that happened. """
+
+        stream = {
+            "url": info["url"],
+            "codec": info.get("acodec"),
+            "bitrate": info.get("abr"),
+            "sample_rate": info.get("asr"),
+            "reduced": False
+        }
+        if not CHANNEL_BITRATE_FORMATS or not self.channel_bitrate or not stream["bitrate"]:
+            return stream
+
+        formats = info["audio_formats"] if "audio_formats" in info else get_audio_formats(info) # Cached info holds them already trimmed.
+        candidates = sorted((f for f in formats if f["acodec"] == stream["codec"]), key=lambda f: f["abr"]) # Same codec, so passthrough stays possible.
+        selected = next((f for f in candidates if f["abr"] >= self.channel_bitrate / 1000), None)
+        if selected is None or selected["abr"] >= stream["bitrate"]:
+            return stream # The channel can carry the best format.
+
+        return {"url": selected["url"], "codec": selected["acodec"], "bitrate": selected["abr"], "sample_rate": selected.get("asr"), "reduced": True}
+
+    def update_channel_bitrate(self, ctx: commands.Context) -> None:
+        if ctx.voice_client is not None:
+            self.channel_bitrate = ctx.voice_client.channel.bitrate
+
+    def get_encode_bitrate(self, data: dict) -> int:
+        """ Returns the Opus bitrate in kbps for transcoded playback, never more than the source or the voice channel carries. """
+
+        bitrate = min(round(data.get("bitrate") or 128), 512) # Same limits discord.py applies to probed bitrates.
+        if CHANNEL_BITRATE_FORMATS and self.channel_bitrate:
+            bitrate = min(bitrate, self.channel_bitrate // 1000)
+        return bitrate
+
+    async def get_stream(self, ctx: commands.Context, webpage: str) -> dict | None:
+        """ Returns the stream information (see get_stream_info()) of a queued track, resolving it if it's not cached or about to expire.
+        Tracks in the audio cache are returned with their local file as URL. Returns None if the track can't be resolved. """
+
+        self.update_channel_bitrate(ctx)
+        video_id = get_video_id(webpage)
+        if self.audio_cache is not None and video_id:
+            stream = await asyncio.to_thread(self.audio_cache.get, video_id)
+            if stream is not None:
+                return stream
+
+        try:
+            info = await asyncio.to_thread(self.fetch_track, ctx, "url", webpage)
+        except Exception:
+            logging.error(f"An error occured while resolving stream URL in function get_stream(); {traceback.format_exc()}")
+            return None
+
+        if isinstance(info, str): # "no_entry" or "invalid_query"
+            return None
+        return self.get_stream_info(info)
+
+    def get_upcoming_tracks(self, amount: int) -> list[Track]:
+        """ Returns the next tracks play_next() is expected to play. Continues into queue_to_loop when the queue is looped. """
+
+        upcoming = list(islice(self.queue, amount))
+        if self.is_looping_queue and len(upcoming) < amount:
+            upcoming += islice(self.queue_to_loop, amount - len(upcoming))
+
+        return upcoming
+
+    async def prefetch(self, ctx: commands.Context) -> None:
+        """ Resolves the stream URLs of the next PREFETCH_COUNT tracks so play_next() finds them in the extraction cache. """
+
+        for track in self.get_upcoming_tracks(PREFETCH_COUNT):
+            video_id = get_video_id(track.webpage)
+            if self.audio_cache is not None and video_id and self.audio_cache.contains(video_id):
+                continue # Played from disk, no stream URL needed.
+
+            try:
+                await asyncio.to_thread(self.fetch_track, ctx, "url", track.webpage)
+            except Exception:
+                logging.error(f"An error occured while prefetching track \"{track.title}\" in function prefetch(); {traceback.format_exc()}")
+
+    def schedule_prefetch(self, ctx: commands.Context) -> None:
+        """ Restarts the background prefetch, called whenever the upcoming tracks might have changed. """
+
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+        self.prefetch_task = self.client.loop.create_task(self.prefetch(ctx))
+
+    """ Stream URL expiry handling.
+    googlevideo URLs stop working after their "expire" timestamp. Upcoming tracks are re-resolved through the
+    extraction cache, which treats URLs close to expiry as stale, and a track whose stream dies early is retried once. """
+
+    async def refresh_streams(self, ctx: commands.Context) -> None:
+        """ Periodically replaces the current track's stream URL (used by seek, rewind, forward and restart)
+        and the upcoming tracks' cached URLs before they expire. """
+
+        while True:
+            await asyncio.sleep(STREAM_REFRESH_INTERVAL)
+
+            expiry = get_stream_expiry(self.source) if self.source else 0
+            if expiry and self.webpage and expiry - STREAM_EXPIRY_MARGIN - STREAM_REFRESH_INTERVAL < time.time(): # Would be stale before the next check.
+                try:
+                    info = await asyncio.to_thread(self.fetch_track, ctx, "url", self.webpage, False) # Skip the cache, it still holds the same URL.
+                    if not isinstance(info, str):
+                        stream = self.get_stream_info(info)
+                        self.source = stream["url"]
+                        self.data.update(codec=stream["codec"], bitrate=stream["bitrate"], sample_rate=stream["sample_rate"], reduced=stream["reduced"]) # The new URL might point to a different format.
+                except Exception:
+                    logging.error(f"An error occured while refreshing stream URL in function refresh_streams(); {traceback.format_exc()}")
+
+            await self.prefetch(ctx)
+
+    def schedule_refresh(self, ctx: commands.Context) -> None:
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = self.client.loop.create_task(self.refresh_streams(ctx))
+
+    def is_stream_failure(self) -> bool:
+        """ Returns True if the current track stopped well before its end without being skipped, which happens
+        when ffmpeg gets a 403 from an expired stream URL or loses the connection. """
+
+        if self.stream_retried or self.is_skipping or not self.source or not self.track_duration:
+            return False
+
+        return self.get_position() < self.track_duration - STREAM_FAILURE_SLACK
+
+    async def retry_stream(self, ctx: commands.Context) -> bool:
+        """ Resolves a new stream URL for the current track, bypassing the cache, and resumes playback where it stopped.
+        Returns False if the track can't be resolved again. """
+
+        self.stream_retried = True
+        position = max(int(self.get_position()), 0)
+        self.shared_sources.forget(get_video_id(self.webpage or "")) # Its frames end where the stream failed, don't replay them.
+        logging.warning(f"Stream of track \"{self.current_track}\" stopped at {position}s out of {self.track_duration}s, retrying with a new stream URL.")
+
+        try:
+            info = await asyncio.to_thread(self.fetch_track, ctx, "url", self.webpage, False) # use_cache=False forces a new extraction, which also refreshes the cache.
+        except Exception:
+            logging.error(f"An error occured while re-resolving stream in function retry_stream(); {traceback.format_exc()}")
+            return False
+
+        if isinstance(info, str):
+            return False
+
+        stream = self.get_stream_info(info)
+        self.data.update(codec=stream["codec"], bitrate=stream["bitrate"], sample_rate=stream["sample_rate"], reduced=stream["reduced"])
+        await self.play_track(ctx, url=stream["url"], data=self.data, seconds=position, mode="retry") # mode=retry keeps the retried flag and avoids the "now playing" message
+        return True
+
+    def get_ffmpeg_options(self, seconds: int, filters: str | None=None, local: bool=False) -> dict:
+        """ Returns a dictionary containing all settings that will be passed to ffmpeg.
+        filters is an ffmpeg audio filter graph, which requires transcoding. local=True leaves out the network options. """
+
+        return {
+            'before_options': (f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 ' if not local else '') + f'-ss {seconds}', # reconnect avoids stopping track playback on disconnect.
+            'options': '-vn' + (f' -af "{filters}"' if filters else '')
+        } # -ss before the input seeks in the input (ranged requests on a URL) instead of decoding everything up to {position}
+
+    def can_passthrough(self, data: dict, filters: str | None) -> bool:
+        """ Returns True if the stream can be sent to Discord without re-encoding: it has to be Opus at 48 kHz
+        (the only rate Discord accepts) and no filter has to touch the decoded audio. """
+
+        if not OPUS_PASSTHROUGH or filters:
+            return False
+
+        return data.get("codec") == "opus" and data.get("sample_rate") in (48000, None) # Opus always decodes at 48 kHz, yt_dlp doesn't always report asr.
+
+    async def create_source(self, url: str, data: dict, seconds: int, filters: str | None=None, buffer: StreamBuffer | None=None) -> discord.AudioSource:
+        """ Returns the audio source of a track at position seconds. Joins the FFmpeg process of another session playing
+        the same track from the same position if there is one, otherwise starts a new one.
+        buffer is the track's stream buffer, the current one is used if it belongs to the track. """
+
+        if filters is None:
+            filters = self.get_audio_filters(data)
+        if buffer is None and self.stream_buffer is not None and self.stream_buffer.webpage == data.get("webpage"):
+            buffer = self.stream_buffer
+
+        video_id = get_video_id(data.get("webpage") or "")
+        if not SHARED_SOURCES or not video_id:
+            return await self.create_ffmpeg_source(url, data, seconds, filters, buffer)
+
+        key = (video_id, seconds, filters, data.get("bitrate"), self.get_encode_bitrate(data)) # Sessions only share output that is identical frame for frame.
+        source = self.shared_sources.subscribe(key)
+        if source is None:
+            source = self.shared_sources.publish(key, await self.create_ffmpeg_source(url, data, seconds, filters, buffer))
+
+        return source
+
+    async def create_ffmpeg_source(self, url: str, data: dict, seconds: int, filters: str | None, buffer: StreamBuffer | None=None) -> discord.AudioSource:
+        """ Builds the FFmpeg audio source directly from the codec and bitrate yt_dlp reported, so no ffprobe process
+        has to connect to the stream first. Streams with an unknown codec are still probed unless they have to be transcoded anyway.
+        Opus streams that don't need filters are demuxed in process instead when WEBM_DEMUXER is enabled.
+        The track is read from its stream buffer when it has one, so the stream is only downloaded once. """
+
+        if WEBM_DEMUXER and self.can_passthrough(data, filters):
+            source = await self.create_demuxed_source(url, data, seconds, buffer)
+            if source is not None:
+                return source
+
+        if buffer is not None and (buffer.covers(seconds) or not seconds and await asyncio.to_thread(buffer.wait_until_ready)):
+            return self.create_buffered_source(buffer, data, seconds, filters)
+
+        codec = data.get("codec")
+        options = self.get_ffmpeg_options(seconds, filters, local=is_local(url))
+        bitrate = self.get_encode_bitrate(data)
+
+        if self.can_passthrough(data, filters):
+            return self.supervisor.register_source(discord.FFmpegOpusAudio(url, bitrate=bitrate, codec="copy", **options)) # Packets are remuxed from WebM to Ogg, never decoded.
+
+        if (not codec or codec == "none") and OPUS_PASSTHROUGH and not filters: # Unknown codec, ffprobe decides between copying and encoding.
+            try:
+                codec, probed_bitrate = await asyncio.to_thread(self.supervisor.probe, url)
+            except Exception: # Probed here instead of through from_probe(), its fallback would run an unsupervised FFmpeg without a timeout.
+                logging.warning(f"Failed to probe \"{data.get('webpage')}\" in function create_ffmpeg_source(), encoding it; {traceback.format_exc()}")
+                codec, probed_bitrate = None, None
+
+            copy = codec in ("opus", "libopus")
+            return self.supervisor.register_source(discord.FFmpegOpusAudio(url, bitrate=probed_bitrate or bitrate, codec="copy" if copy else None, **options))
+
+        return self.supervisor.register_source(discord.FFmpegOpusAudio(url, bitrate=bitrate, codec=None, **options)) # Decoded, filtered and encoded to Opus with libopus.
+
+    async def create_demuxed_source(self, url: str, data: dict, seconds: int, buffer: StreamBuffer | None=None) -> WebMOpusSource | None:
+        """ Returns a WebMOpusSource for the track, reading the stream buffer's file when the track is fully buffered and
+        the part that's already downloaded while it's buffering. Returns None if the stream can't be demuxed, the caller falls back to FFmpeg. """
+
+        reading_buffer = None
+        if buffer is not None and buffer.complete and not buffer.closed:
+            url = buffer.file_path
+        elif buffer is not None and await asyncio.to_thread(buffer.wait_until_ready): # Headers, Cues and the target cluster are each read locally if the download got to them.
+            reading_buffer = buffer
+
+        try:
+            return await asyncio.to_thread(WebMOpusSource, url, seconds, self.connection_pool, reading_buffer) # Reads the headers and the first packet.
+        except DemuxError as e:
+            logging.warning(f"Falling back to FFmpeg for \"{data.get('webpage')}\" in function create_demuxed_source(); {e}")
+        except Exception:
+            logging.error(f"Failed to demux \"{data.get('webpage')}\" in function create_demuxed_source(), falling back to FFmpeg; {traceback.format_exc()}")
+
+        return None
+
+    """ Channel bitrate tuning.
+    The stream format and the encoder bitrate are picked from the voice channel's bitrate when a track starts.
+    When the bitrate changes mid-track, the track is restarted at its position with the matching format. """
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+        if not isinstance(after, discord.VoiceChannel) or before.bitrate == after.bitrate:
+            return
+
+        voice_client = after.guild.voice_client
+        if voice_client is None or voice_client.channel.id != after.id:
+            return
+
+        self.channel_bitrate = after.bitrate
+        if CHANNEL_BITRATE_FORMATS and voice_client.is_playing() and self.playback_ctx is not None:
+            try:
+                await self.retune(self.playback_ctx)
+            except Exception:
+                logging.error(f"An error occured while re-tuning playback in function on_guild_channel_update(); {traceback.format_exc()}")
+
+    async def retune(self, ctx: commands.Context) -> None:
+        """ Restarts the current track at its position if the channel's bitrate calls for another format or encoder bitrate. """
+
+        if not self.webpage or not self.source:
+            return
+
+        stream = await self.get_stream(ctx, self.webpage)
+        if stream is None:
+            return
+        if stream["url"] == self.source and self.can_passthrough(self.data, self.get_audio_filters(self.data)):
+            return # Same format copied as it is, the encoder bitrate doesn't matter.
+
+        position = max(int(self.get_position()), 0)
+        self.data.update(codec=stream["codec"], bitrate=stream["bitrate"], sample_rate=stream["sample_rate"], reduced=stream.get("reduced", False))
+        if stream["url"] != self.source:
+            self.close_buffer() # The buffer holds the previous format.
+
+        await self.play_track(ctx, url=stream["url"], data=self.data, seconds=position, mode="retune") # mode=retune avoids the "now playing" message. Not buffered again, seeks use ranged requests.
+
+    """ FFmpeg process supervision.
+    Sources can outlive their playback when play_track() fails after creating one, or when leave and stop race
+    with the after callback. Their processes are found by the supervisor and killed. """
+
+    def get_live_sources(self) -> set[discord.AudioSource]:
+        """ Returns the sources that are allowed to keep their FFmpeg process: the ones playing on a voice client and the preloaded one. """
+
+        live_sources = {voice_client.source for voice_client in self.client.voice_clients if voice_client.source is not None}
+        if self.preloaded is not None:
+            live_sources.add(self.preloaded[2])
+
+        live_sources |= {source.original for source in live_sources if isinstance(source, PositionTrackingSource)}
+        live_sources |= {source.upstream.source for source in live_sources if isinstance(source, SharedAudioSource)} # The FFmpeg source behind a subscriber.
+        live_sources |= self.shared_sources.get_sources() # Shared tracks waiting for a replay.
+
+        return live_sources
+
+    async def supervise(self) -> None:
+        while True:
+            await asyncio.sleep(SUPERVISOR_INTERVAL)
 
-        FFMPEG_OPTIONS_CUSTOM = {
-            'before_options': f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5', # reconnect avoids stopping track playback on disconnect.
-            'options': f'-ss {seconds} -vn'
-        } # -ss means seek to {position}
+            try:
+                await asyncio.to_thread(self.supervisor.sample)
+                self.shared_sources.purge()
+                self.supervisor.reap(self.get_live_sources())
+            except Exception:
+                logging.error(f"An error occured while supervising FFmpeg processes in function supervise(); {traceback.format_exc()}")
+
+            try:
+                await asyncio.to_thread(self.extraction_cache.flush) # Persisted here rather than on every extraction or cache hit.
+                await asyncio.to_thread(self.search_cache.flush)
+                if self.audio_cache is not None:
+                    await asyncio.to_thread(self.audio_cache.flush)
+            except Exception:
+                logging.error(f"An error occured while saving the caches in function supervise(); {traceback.format_exc()}")
+
+    """ Loudness normalization.
+    Tracks are measured once, from their stream buffer or their audio cache file, and later plays apply a static
+    volume filter. A track that hasn't been measured yet plays unchanged. """
+
+    def get_audio_filters(self, data: dict) -> str | None:
+        """ Returns the ffmpeg filter graph for a track, None if it can be played as it is. """
+
+        video_id = get_video_id(data.get("webpage") or "")
+        if self.loudness is None or not video_id:
+            return None
+
+        gain = self.loudness.get_gain(video_id)
+        if gain is None:
+            return None
+        return f"volume={gain}dB"
+
+    def analyze_cached(self, url: str, data: dict) -> None:
+        """ Measures a track played from the audio cache that was cached before it could be measured. """
+
+        video_id = get_video_id(data.get("webpage") or "")
+        if self.loudness is None or not video_id or not is_local(url) or self.loudness.contains(video_id):
+            return
+
+        self.client.loop.create_task(asyncio.to_thread(self.loudness.analyze, video_id, url))
+
+    """ Playing and seeking from the local stream buffer.
+    A track's stream is downloaded once to a temporary file (see streambuffer.py) and playback reads that file as the download
+    goes. Seeking into the downloaded part starts FFmpeg on the local data, positions past it seek in the stream with ranged requests. """
+
+    def create_buffered_source(self, buffer: StreamBuffer, data: dict, seconds: int, filters: str | None=None) -> discord.FFmpegOpusAudio:
+        """ Returns a source reading from the buffer's file, or from a reader that waits for the download if it's still running. """
+
+        bitrate = self.get_encode_bitrate(data)
+        codec = "copy" if self.can_passthrough(data, filters) else None
+        options = self.get_ffmpeg_options(seconds, filters, local=True)
+
+        if buffer.complete:
+            return self.supervisor.register_source(discord.FFmpegOpusAudio(buffer.file_path, bitrate=bitrate, codec=codec, **options)) # FFmpeg seeks in the file directly.
+        return self.supervisor.register_source(BufferedOpusAudio(buffer.open_reader(), bitrate=bitrate, codec=codec, **options)) # Skipping to the position in local data takes milliseconds.
+
+    def create_buffer(self, url: str, data: dict) -> StreamBuffer | None:
+        """ Starts buffering a track, returns None if it isn't buffered. Reuses the current buffer if it belongs to the track (restart, loop). """
+
+        if not STREAM_BUFFER or not data.get("duration") or is_local(url): # Tracks played from the audio cache are already on disk.
+            return None
+        if self.stream_buffer is not None and self.stream_buffer.webpage == data["webpage"] and not self.stream_buffer.failed:
+            return self.stream_buffer
+
+        buffer = StreamBuffer(url, data["webpage"], data["duration"], STREAM_BUFFER_MAX_BYTES, on_complete=self.get_buffer_callback(data))
+        buffer.start()
+        return buffer
+
+    def adopt_buffer(self, buffer: StreamBuffer | None) -> None:
+        """ Makes buffer the current track's buffer, closing the previous one. """
+
+        if buffer is not self.stream_buffer:
+            self.close_buffer()
+            self.stream_buffer = buffer
+
+    def get_buffer_callback(self, data: dict) -> Callable[[StreamBuffer], None] | None:
+        """ Returns the callback run in the download thread once a track is completely buffered. It copies the track
+        into the audio cache and measures its loudness. Returns None if there's nothing to do. """
+
+        video_id = get_video_id(data["webpage"])
+        if self.audio_cache is None and self.loudness is None or not video_id:
+            return None
+
+        stream = {"codec": data.get("codec"), "bitrate": data.get("bitrate"), "sample_rate": data.get("sample_rate")}
+
+        def on_complete(buffer: StreamBuffer) -> None:
+            if self.audio_cache is not None and not data.get("reduced"): # A reduced format would be replayed in channels with a higher bitrate.
+                self.audio_cache.put(video_id, buffer.file_path, stream)
+            if self.loudness is not None:
+                snapshot = None if self.loudness.contains(video_id) else self.loudness.take_snapshot(buffer.file_path) # The buffer file is deleted when the next track starts, the analysis can outlive it.
+                if snapshot is not None:
+                    self.loudness.analyze(video_id, snapshot, remove=True)
+
+        return on_complete
+
+    def close_buffer(self) -> None:
+        if self.stream_buffer is not None:
+            self.stream_buffer.close()
+            self.stream_buffer = None
+
+    """ Gapless playback.
+    Shortly before the current track ends, the next one is resolved and its FFmpeg process
+    is started, so play_next() can hand it to the voice client without waiting for FFmpeg to start and connect to the stream. """
+
+    def get_next_track(self) -> Track | None:
+        """ Returns the queue entry play_next() will play next, picking it in advance when is_random is enabled. """
+
+        if self.is_looping and self.track_to_loop and not self.is_random:
+            return self.track_to_loop
+        if self.queue:
+            return self.queue[0] if not self.is_random else self.queue.pick_random(SHUFFLE_WEIGHTING == "requester")
+        if self.is_looping_queue and self.queue_to_loop:
+            return self.queue_to_loop[0] if not self.is_random else self.queue_to_loop.pick_random(SHUFFLE_WEIGHTING == "requester")
+
+        return None
+
+    async def preload(self, ctx: commands.Context) -> None:
+        remaining = self.track_duration - self.get_position() - GAPLESS_PRELOAD_SECONDS
+        while remaining > 0:
+            await asyncio.sleep(remaining) # The position doesn't move while paused, so check again after waking up.
+            remaining = self.track_duration - self.get_position() - GAPLESS_PRELOAD_SECONDS
+
+        track = self.get_next_track()
+        if track is None:
+            return
+
+        stream = await self.get_stream(ctx, track.webpage)
+        if stream is None:
+            return
+
+        data = {**stream, "title": track.title, "duration": track.duration, "webpage": track.webpage}
+        buffer = self.create_buffer(stream["url"], data) # The source reads from it, so the track is only downloaded once.
+        try:
+            source = await self.create_source(stream["url"], data, 0, buffer=buffer)
+        except Exception:
+            logging.error(f"An error occured while preloading track \"{track.title}\" in function preload(); {traceback.format_exc()}")
+            if buffer is not None and buffer is not self.stream_buffer:
+                buffer.close()
+            return
+
+        self.preloaded = (track, stream, source, buffer)
+
+    def schedule_preload(self, ctx: commands.Context) -> None:
+        """ Discards any prepared source and schedules the next track to be prepared GAPLESS_PRELOAD_SECONDS before the current one ends. """
+
+        self.discard_preload()
+        if not GAPLESS_PLAYBACK or not self.track_duration:
+            return
+
+        self.preload_task = self.client.loop.create_task(self.preload(ctx))
+
+    def take_preloaded(self, track: Track) -> tuple[dict, discord.AudioSource, StreamBuffer | None] | tuple[None, None, None]:
+        """ Returns the prepared stream information, source and buffer if they belong to track, otherwise discards them. """
+
+        if self.preloaded is not None and self.preloaded[0] == track:
+            track, stream, source, buffer = self.preloaded
+            self.preloaded = None
+            return stream, source, buffer
+
+        self.discard_preload()
+        return None, None, None
+
+    def discard_preload(self) -> None:
+        if self.preload_task is not None:
+            self.preload_task.cancel()
+            self.preload_task = None
+
+        if self.preloaded is not None:
+            track, stream, source, buffer = self.preloaded
+            source.cleanup() # Kills the FFmpeg process that was never played.
+            if buffer is not None and buffer is not self.stream_buffer:
+                buffer.close()
+            self.preloaded = None
+
+    async def play_track(self, ctx: commands.Context, url: str, data: dict, seconds: int=0, mode: str="default", source: discord.AudioSource | None=None, buffer: StreamBuffer | None=None): # mode can be either "rewind" "seek" "forward" or "default"
+        """ Plays the track by launching a FFmpeg process with the options from get_ffmpeg_options(), or with an already prepared source
+        and the stream buffer it reads from. Also updates the data dictionary with new information. """
+        
+        self.last_elapsed_time = int(self.get_position()) # Update time so it shows correctly in nowplaying / duration
 
         try:
-            source = await discord.FFmpegOpusAudio.from_probe(url, **FFMPEG_OPTIONS_CUSTOM) # URL is the audio source extracted by yt.extract_info() in fetch_track()
+            if source is None:
+                if mode == "default":
+                    buffer = self.create_buffer(url, data) # Started before the source, which reads the track from it.
+                source = await self.create_source(url, data, seconds, buffer=buffer) # URL is the audio source extracted by yt.extract_info() in fetch_track()
             
             if ctx.voice_client.is_playing() or ctx.voice_client.is_paused(): # ctx.voice_client is the same as self.voice_client
                 self.after = False # Stops the bot from calling play_next() infinitely
                 ctx.voice_client.stop()
+            if mode == "default":
+                self.adopt_buffer(buffer) # Only now, the previous track may still be reading its buffer until it's stopped.
+            source = PositionTrackingSource(source, seconds) # The position advances with every frame the voice client sends.
             ctx.voice_client.play(source, after=lambda _:self.client.loop.create_task(self.play_next(ctx))) # Plays audio through FFmpeg
 
             """ Update time and track variables """
 
-            self.start_time = time.time() - seconds # Set start time, needed to keep track of elapsed time.
+            self.tracked_source = source
             self.last_elapsed_time = seconds # Elapsed time since the start of the track. Can be any number between 0 and the track length
 
             """ Track information will be stored in the self.data dictionary """
@@ -318,12 +836,16 @@ class Mixer(commands.Cog):
             self.thumbnail_url = data["thumbnail_url"]
             self.webpage = data["webpage"]
             self.source = url
+            self.playback_ctx = ctx
 
-            if self.current_track is not None:
-                if self.current_track not in self.queue_history:
-                    self.queue_history.append(self.current_track)
+            self.schedule_preload(ctx) # The end of the track moved, prepare the next one relative to the new position.
 
             if mode == "default": # Check to make the "Now playing" message only appear when playing the track automatically or by selecting it, not when seeking into it.
+                self.stream_retried = False
+                self.queue_history.record(get_video_id(data["webpage"]) or data["webpage"], data["title"], data["webpage"], data.get("requester"), int(time.time()))
+                self.analyze_cached(url, data)
+                self.schedule_prefetch(ctx)
+                self.schedule_refresh(ctx)
                 await self.nowplaying(ctx)
         except discord.ClientException as e:
             await ctx.send("Failed to create FFmpeg process.")
@@ -337,6 +859,9 @@ class Mixer(commands.Cog):
             await ctx.send("An error occured while playing track.")
             logging.error(f"An error occured in function play_track(): {traceback.format_exc()}")
             return
+        finally:
+            if buffer is not None and buffer is not self.stream_buffer: # Playback failed before the buffer was adopted.
+                buffer.close()
 
     @commands.command(name="join", help="Requests the bot to join the user's channel.")
     async def join(self, ctx: commands.Context) -> None:
@@ -467,51 +992,70 @@ class Mixer(commands.Cog):
                 colour=discord.Colour.random(seed=random.randint(1, 1000)),
                 timestamp=datetime.now()
             )
-            async with ctx.typing(): # Makes the bot send a "is typing" request to the channel so that it makes it look like it's working from the user's perspective
-                for query in queries:
-                    query_type = self.get_query_type(query) # Figure out the query type (std_query, url)
-                    
-                    try:
-                        info = await asyncio.to_thread(self.fetch_track, ctx, query_type, query) # Use to_thread() to avoid blocking code.
-                        
-                        if info == "invalid_query":
-                            failed_tracks.append((query, "Invalid query type"))
-                            continue
-                        elif info == "no_entry":
-                            failed_tracks.append((query, "No entries found for this query"))
+            """ Queries are extracted in parallel but consumed in order, so tracks are queued as soon as every query before them
+            is resolved. Playback starts with the first track while the rest keep resolving, and a single status message reports progress. """
+
+            status = await ctx.send(f"Resolving **{len(queries)}** {"query" if len(queries) == 1 else "queries"}...")
+            last_update = time.time()
+            started_playback = False
+            tasks = self.start_resolving(ctx, queries)
+
+            for index, (query, task) in enumerate(zip(queries, tasks)):
+                if not started_playback and self.queue and not ctx.voice_client.is_playing() and not ctx.voice_client.is_paused():
+                    started_playback = True
+                    await self.play_next(ctx) # Start playing the first resolved track instead of waiting for the whole batch.
+
+                if time.time() - last_update >= ADD_PROGRESS_INTERVAL: # Throttled to stay well under Discord's message edit rate limit.
+                    await status.edit(content=f"Resolved **{index}/{len(queries)}** queries, added **{len(added_tracks)}** tracks...")
+                    last_update = time.time()
+
+                info = await task
+
+                try:
+                    if info == "invalid_query":
+                        failed_tracks.append((query, "Invalid query type"))
+                        continue
+                    elif info == "no_entry":
+                        failed_tracks.append((query, "No entries found for this query"))
+                        continue
+                    elif info == "unknown_error":
+                        failed_tracks.append((query, "Unknown error"))
+                        continue
+
+                    for track_info in (info if isinstance(info, list) else [info]): # Playlists resolve to multiple tracks.
+                        if len(self.queue) >= 100:
+                            failed_tracks.append((track_info["title"], "Queue limit reached"))
                             continue
 
                         """ Collect matching track's information, including the source audio
                         and append it to the queue. """
 
-                        webpage = info["webpage_url"]
-                        url = info["url"]
-                        title = info["title"]
-                        thumbnail_url = info.get("thumbnail")
-                        duration = info.get("duration", 0)
+                        track = Track(track_info["title"], track_info.get("duration", 0), track_info.get("thumbnail"), track_info["webpage_url"], requester=ctx.author.id) # Stream URLs expire, so only stable metadata is queued. play_next() resolves the URL when the track is about to play.
 
                         """ Append data to their respective queues
                         which will later be accessed by play_track(). """
 
-                        self.queue.append((url, title, duration, thumbnail_url, webpage))
-                        if (url, title, duration, thumbnail_url, webpage) not in self.queue_to_loop:
-                            self.queue_to_loop.append((url, title, duration, thumbnail_url, webpage))
-                        added_tracks.append(title)
+                        self.queue.append(track)
+                        self.queue_to_loop.append(track) # Same object, so the entry can be found in both queues by identity.
+                        added_tracks.append(track.title)
 
-                    except Exception:
-                        failed_tracks.append((query, "Unknown error"))
-                        continue
-                if added_tracks:
-                    embed.add_field(name=f"Added tracks **({len(queries)})**", value=self.get_single_track_queue(added_tracks), inline=False)
-                if failed_tracks:
-                    embed.add_field(name="Tracks not added", value=f"\n".join(f"**{query}**, ({error})" for query, error in failed_tracks))
-                if not added_tracks and not failed_tracks:
-                    await ctx.send("No tracks were added.")
-                    return
+                except Exception:
+                    failed_tracks.append((query, "Unknown error"))
+                    continue
+            if added_tracks:
+                embed.add_field(name=f"Added tracks **({len(added_tracks)})**", value=self.get_single_track_queue(added_tracks), inline=False)
+            if failed_tracks:
+                embed.add_field(name="Tracks not added", value=f"\n".join(f"**{query}**, ({error})" for query, error in failed_tracks))
+            if not added_tracks and not failed_tracks:
+                await status.edit(content="No tracks were added.")
+                self.is_modifying_queue = False
+                return
 
-                await ctx.send(embed=embed)
-            if not ctx.voice_client.is_playing():
+            await status.edit(content=None, embed=embed) # Replace the progress message with the summary.
+            if not started_playback and not ctx.voice_client.is_playing():
                 await self.play_next(ctx)
+            else:
+                self.schedule_prefetch(ctx) # Tracks queued after playback started still need to be prefetched.
             self.is_modifying_queue = False
         else:
             await ctx.send("No queries were given. Command aborted.")
@@ -532,16 +1076,25 @@ class Mixer(commands.Cog):
         if len(ctx.voice_client.channel.members) == 1:
             await ctx.send(f"Disconnecting from voice channel **{ctx.voice_client.channel.name}**...\nReason: No users left in channel.")
             self.after = False
+            self.discard_preload()
+            if self.refresh_task is not None:
+                self.refresh_task.cancel()
+                self.refresh_task = None
+            self.close_buffer()
             await ctx.voice_client.disconnect()
 
             return
 
+        if self.is_stream_failure() and await self.retry_stream(ctx):
+            return
+        self.is_skipping = False
+
         """ self.track_to_loop will be assigned the current track's info
         every time this function is called, so when replaying it again and self.is_looping is enabled
         it can loop until it's disabled. """
 
         if self.is_looping and self.track_to_loop and not self.is_random:
-            url, title, duration, thumbnail_url, webpage = self.track_to_loop
+            track = self.track_to_loop
         
         if self.is_looping_queue and not self.queue and self.queue_to_loop:
             self.queue = self.queue_to_loop.copy() # Copy the saved queue to the main queue to loop it
@@ -549,20 +1102,37 @@ class Mixer(commands.Cog):
         if self.queue or self.is_looping or self.is_looping_queue:
             
             if not self.is_looping:
-                url, title, duration, thumbnail_url, webpage = self.queue.pop(0) if not self.is_random else self.queue.pop(self.queue.index(random.choice(self.queue))) # Get the current track from the queue list
-                self.track_to_loop = (url, title, duration, thumbnail_url, webpage) # Set it to the track_to_loop variable, in case it's needed for looping
+                track = None
+                if self.is_random and self.preloaded is not None:
+                    track = self.queue.take(self.preloaded[0]) # Play the random track that was picked and prepared in advance, None if it was removed since.
+                if track is None:
+                    track = self.queue.pop(0) if not self.is_random else self.queue.take(self.queue.pick_random(SHUFFLE_WEIGHTING == "requester")) # Get the current track from the queue
+                self.track_to_loop = track # Set it to the track_to_loop variable, in case it's needed for looping
 
             try:
+                stream, source, buffer = self.take_preloaded(track)
+                if stream is None:
+                    stream = await self.get_stream(ctx, track.webpage) # Usually a cache hit, prefetch() resolved it while the previous track was playing.
+                if stream is None:
+                    await ctx.send(f"Failed to resolve track **{track.title}**, skipping it.")
+                    if self.queue and not self.is_looping:
+                        await self.play_next(ctx)
+                    return
+
                 self.data = {
-                    "title": title,
-                    "duration": duration,
-                    "thumbnail_url": thumbnail_url,
-                    "webpage": webpage
+                    "title": track.title,
+                    "duration": track.duration,
+                    "thumbnail_url": track.thumbnail_url,
+                    "webpage": track.webpage,
+                    "codec": stream["codec"],
+                    "bitrate": stream["bitrate"],
+                    "sample_rate": stream["sample_rate"],
+                    "reduced": stream.get("reduced", False), # Streams from the audio cache have no reduced flag.
+                    "requester": track.requester
                 }
-                self.start_time = time.time()
                 self.last_elapsed_time = 0
 
-                await self.play_track(ctx, url=url, data=self.data, seconds=0, mode="default")
+                await self.play_track(ctx, url=stream["url"], data=self.data, seconds=0, mode="default", source=source, buffer=buffer)
 
             except Exception as e:
                 await ctx.send(f"Error while playing the next track.")
@@ -604,6 +1174,7 @@ class Mixer(commands.Cog):
 
         if ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
             self.is_looping = False # Stop the bot from looping
+            self.is_skipping = True
             ctx.voice_client.stop() # By calling this without setting self.after to False we execute the "after" func passed in ctx.voice_client.play()
 
             await ctx.send(f"Skipped track **{self.current_track}**.")
@@ -622,7 +1193,7 @@ class Mixer(commands.Cog):
         if ctx.voice_client:
             if ctx.voice_client.is_playing():
                 ctx.voice_client.pause()
-                self.last_elapsed_time = int(time.time() - self.start_time) # Update elapsed time
+                self.last_elapsed_time = int(self.get_position()) # Update elapsed time
             else:
                 await ctx.send("I'm not playing anything!")
                 return
@@ -646,7 +1217,6 @@ class Mixer(commands.Cog):
             return
             
         if ctx.voice_client.is_paused():
-            self.start_time = time.time() - self.last_elapsed_time
             ctx.voice_client.resume()
         else:
             await ctx.send("I'm not paused!")
@@ -712,7 +1282,7 @@ class Mixer(commands.Cog):
                 return
             
             if position_seconds > 0 and position_seconds <= self.data["duration"]:
-                new_position = int(time.time() - self.start_time) - position_seconds
+                new_position = max(int(self.get_position()) - position_seconds, 0)
     
                 await self.play_track(ctx, url=self.source, data=self.data, seconds=new_position, mode="rewind")
                 await ctx.send(f"Rewound by {position} seconds. Now at {format_time(new_position)} seconds.")
@@ -749,10 +1319,10 @@ class Mixer(commands.Cog):
                 return
             
             if position_seconds > 0 and position_seconds <= self.data["duration"]:
-                new_position = int(time.time() - self.start_time) + position_seconds
+                new_position = int(self.get_position()) + position_seconds
                 
                 await self.play_track(ctx, url=self.source, data=self.data, seconds=new_position, mode="forward")
-                await ctx.send(f"Forwarded by {position} seconds. Now at {format_time(self.last_elapsed_time)} seconds.")
+                await ctx.send(f"Forwarded by {position} seconds. Now at {format_time(new_position)} seconds.")
             else:
                 await ctx.send("Invalid forward position.")
                 return
@@ -840,7 +1410,7 @@ class Mixer(commands.Cog):
         )
 
         if not ctx.voice_client.is_paused():
-            self.last_elapsed_time = int(time.time() - self.start_time) # Get track elapsed time.
+            self.last_elapsed_time = int(self.get_position()) # Get track elapsed time.
 
         embed.add_field(name="Track duration", value=f"{format_time(self.track_duration)} Minutes", inline=True)
         embed.add_field(name="Elapsed time", value=f"{format_time(self.last_elapsed_time)} Minutes", inline=True) if not ctx.voice_client.is_paused() and ctx.voice_client.is_playing() else embed.add_field(name="Elapsed time", value=f"{format_time(self.last_elapsed_time)} Minutes", inline=True)
@@ -866,7 +1436,6 @@ class Mixer(commands.Cog):
         effectively restarting the track. """
 
         if ctx.voice_client.is_playing() or ctx.voice_client.is_paused():
-            self.start_time = time.time()
             self.last_elapsed_time = 0
             await self.play_track(ctx, url=self.source, data=self.data, seconds=0, mode="default")
         else:
@@ -927,7 +1496,7 @@ class Mixer(commands.Cog):
         """ Reset queues to their original defaults by emptying the lists. """
 
         old_queue = self.queue[:]
-        old_queue_history = self.queue_history[:]
+        old_history_length = len(self.queue_history)
         old_is_looping_queue = self.is_looping_queue
         old_is_looping = self.is_looping
         old_is_random = self.is_random
@@ -945,7 +1514,7 @@ class Mixer(commands.Cog):
             timestamp=datetime.now()
         )
 
-        embed.add_field(name="Values reset", value=f"Queue: **{len(self.queue)}** (previous: **{len(old_queue)}**)\nHistory: **{len(self.queue_history)}** (previous: **{len(old_queue_history)}**)\nQueue loop: **{self.is_looping_queue}** (previous: **{old_is_looping_queue}**)\nLoop: **{self.is_looping}** (previous: **{old_is_looping}**)\nRandom choice: **{self.is_random}** (previous: **{old_is_random}**)")
+        embed.add_field(name="Values reset", value=f"Queue: **{len(self.queue)}** (previous: **{len(old_queue)}**)\nHistory: **{len(self.queue_history)}** (previous: **{old_history_length}**)\nQueue loop: **{self.is_looping_queue}** (previous: **{old_is_looping_queue}**)\nLoop: **{self.is_looping}** (previous: **{old_is_looping}**)\nRandom choice: **{self.is_random}** (previous: **{old_is_random}**)")
         await ctx.send(embed=embed)
 
         self.is_modifying_queue = False
@@ -1055,21 +1624,32 @@ class Mixer(commands.Cog):
             self.queue_to_loop.clear()
             await ctx.send("The queue will no longer be looped.")
 
-    @commands.command(name="history", help="Outputs the previously played tracks.")
-    async def history(self, ctx: commands.Context) -> None:
+    @commands.command(name="history", help="Outputs the previously played tracks, most recent first. Takes an optional page number.")
+    async def history(self, ctx: commands.Context, page: int=1) -> None:
         meets_role_requirement = await self.check_for_role(ctx, REQUIRED_ROLE_NAME)
         if meets_role_requirement == False:
             await ctx.send("You do not have the required role to use this command.")
             return
         
         if self.queue_history:
+            pages = (len(self.queue_history) + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            if page < 1 or page > pages:
+                await ctx.send(f"Invalid page. Type a number between **1** and **{pages}**.")
+                return
+
+            start = (page - 1) * HISTORY_PAGE_SIZE
+            lines = []
+            for number, entry in enumerate(self.queue_history.get_entries(start, HISTORY_PAGE_SIZE), start=start + 1):
+                requester = f" - <@{entry["requester"]}>" if entry["requester"] else ""
+                lines.append(f"**{number}.** [{entry["title"]}]({entry["webpage"]}){requester} <t:{entry["time"]}:R>")
+
             embed = discord.Embed(
                 title="Queue History",
+                description="\n".join(lines), # Descriptions hold up to 4096 characters, fields only 1024.
                 colour=discord.Colour.random(seed=random.randint(1, 1000)),
                 timestamp=datetime.now()
             )
-
-            embed.add_field(name="All previously played tracks", value=self.get_single_track_queue(self.queue_history), inline=False) # get_single_track_queue() returns a string with all the tracks in an array with a [(url, title, duration, thumbnail_url, webpage)] structure.
+            embed.set_footer(text=f"Page {page}/{pages} - {len(self.queue_history)} tracks")
 
             await ctx.send(embed=embed)
         else:
@@ -1110,18 +1690,13 @@ class Mixer(commands.Cog):
 
         try:
             old_queue = self.queue[:]
-            self.queue = self.shuffle_queue(self.queue) # shuffle_queue() simply returns a new list after being shuffled by random.shuffle()
+            self.queue = self.shuffle_queue(self.queue) # shuffle_queue() simply returns a new queue shuffled by random.shuffle()
             self.queue_to_loop = self.queue.copy()
 
             embed.add_field(name="The queue has been shuffled", value="", inline=False)
-            visual_queue = self.queue[:]
-            
-            for i, (url, title_new, duration, thumbnail_url, webpage) in enumerate(self.queue):
-                old_url, old_title, old_duration, old_thumbnail, old_webpage = old_queue[i]
-                if title_new != old_title:
-                    visual_queue[i] = (url, f"**{title_new}**", duration, thumbnail_url, webpage)
+            visual_queue = [track.title if track.title == old_track.title else f"**{track.title}**" for track, old_track in zip(self.queue, old_queue)] # Moved tracks are shown in bold.
 
-            embed.add_field(name="New queue", value=", ".join(title_new for url, title_new, duration, thumbnail_url, webpage in visual_queue))
+            embed.add_field(name="New queue", value=", ".join(visual_queue))
             embed.add_field(name="Old queue", value=self.get_tracks(old_queue))
 
             await ctx.send(embed=embed)
@@ -1167,7 +1742,7 @@ class Mixer(commands.Cog):
             return
 
         previous = self.queue[:]
-        self.queue = sorted(self.queue, key=lambda track: track[1]) # Sorts list alphabetically using the second item (title) of the tuple.
+        self.queue = TrackQueue(sorted(self.queue, key=lambda track: track.title)) # Sorts the queue alphabetically by title.
         self.queue_to_loop = self.queue.copy()
 
         if previous != self.queue:
@@ -1276,27 +1851,41 @@ class Mixer(commands.Cog):
             return
 
         try:
-            for i, (url, title, duration, thumbnail_url, webpage) in enumerate(self.queue):
-                found = False
-                if track.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                    self.data = {
-                        "title": title,
-                        "duration": duration,
-                        "thumbnail_url": thumbnail_url,
-                        "webpage": webpage
-                    }
-                    
-                    self.track_to_loop = url, title, duration, thumbnail_url, webpage
+            i, queued_track = self.queue.find(track)
+            if queued_track is None:
+                await ctx.send("No matching track found.")
+                return
+
+            self.queue.pop(i) # Taken out before resolving, play_next() can change the queue while get_stream() waits.
+            try:
+                stream = await self.get_stream(ctx, queued_track.webpage) # Queued tracks don't store a stream URL.
+            except Exception:
+                self.queue.insert(i, queued_track)
+                raise
 
-                    await self.play_track(ctx, url=url, data=self.data, seconds=0, mode="default")
-                    selected_track = self.queue.pop(i)
+            if stream is None:
+                self.queue.insert(i, queued_track) # Put back where it was, as far as the queue allows.
+                await ctx.send(f"Failed to resolve track **{queued_track.title}**.")
+                return
 
-                    if selected_track in self.queue_to_loop:
-                        self.queue_to_loop.remove(selected_track)
-                    found = True
-                    break
-            if not found:
-                await ctx.send("No matching track found.")
+            self.data = {
+                "title": queued_track.title,
+                "duration": queued_track.duration,
+                "thumbnail_url": queued_track.thumbnail_url,
+                "webpage": queued_track.webpage,
+                "codec": stream["codec"],
+                "bitrate": stream["bitrate"],
+                "sample_rate": stream["sample_rate"],
+                "reduced": stream.get("reduced", False),
+                "requester": queued_track.requester
+            }
+            
+            self.track_to_loop = queued_track
+
+            await self.play_track(ctx, url=stream["url"], data=self.data, seconds=0, mode="default")
+
+            if queued_track in self.queue_to_loop:
+                self.queue_to_loop.remove(queued_track)
 
         except Exception as e:
             await ctx.send(f"An error occured while parsing queue.")
@@ -1383,7 +1972,7 @@ class Mixer(commands.Cog):
         async with ctx.typing():
             old_track = None
             if self.source and self.data["title"] and self.data["duration"] and self.data["thumbnail_url"] and self.data["webpage"]:
-                old_track = self.source, self.data["title"], self.data["duration"], self.data["thumbnail_url"], self.data["webpage"]
+                old_track = Track(self.data["title"], self.data["duration"], self.data["thumbnail_url"], self.data["webpage"], requester=self.data.get("requester")) # The stream URL is resolved again when the track gets replayed.
             
             try:
                 query_type = self.get_query_type(query)
@@ -1397,13 +1986,20 @@ class Mixer(commands.Cog):
                     await ctx.send(f"Invalid query type for query **{query}**. Only YouTube search queries and URLs are supported.")
                     return
                 
-                url, title, duration, thumbnail_url, webpage = info["url"], info["title"], info.get("duration", 0), info.get("thumbnail", None), info["webpage_url"]
+                self.update_channel_bitrate(ctx)
+                stream = self.get_stream_info(info)
+                url, title, duration, thumbnail_url, webpage = stream["url"], info["title"], info.get("duration", 0), info.get("thumbnail", None), info["webpage_url"]
 
                 self.data = {
                     "title": title,
                     "duration": duration,
                     "thumbnail_url": thumbnail_url,
-                    "webpage": webpage
+                    "webpage": webpage,
+                    "codec": stream["codec"],
+                    "bitrate": stream["bitrate"],
+                    "sample_rate": stream["sample_rate"],
+                    "reduced": stream["reduced"],
+                    "requester": ctx.author.id
                 }
 
                 await self.play_track(ctx, url=url, data=self.data, seconds=0, mode="default")
@@ -1478,7 +2074,28 @@ class Mixer(commands.Cog):
             logging.error(f"An error occured in function read_playlist(); {traceback.format_exc()}")
             return "unknown_error"
 
+    def get_playlist_index(self, guild_id: int, playlist: list) -> TitleIndex:
+        """ Returns the title index of a guild's playlist, keyed by track position. The index is rebuilt only when
+        playlists.json was written since it was built, playlists are read from the file on every command. """
+
+        try:
+            modified = os.stat(PLAYLIST_FILENAME).st_mtime_ns
+        except OSError:
+            modified = None
+
+        cached = self.playlist_indexes.get(guild_id)
+        if cached is not None and modified is not None and cached[0] == modified and len(cached[1]) == len(playlist):
+            return cached[1]
+
+        index = TitleIndex()
+        for position, (title, webpage) in enumerate(playlist):
+            index.add(position, normalize_title(title))
+
+        self.playlist_indexes[guild_id] = (modified, index)
+        return index
+
     def write_playlist(self, file_path: str, content: dict) -> None | str:
+        self.playlist_indexes.clear() # Writes can land within the file system's timestamp granularity, don't rely on the modification time alone.
         try:
             with open(file_path, "w") as f:
                 json.dump(content, f, indent=4)
@@ -1529,7 +2146,7 @@ class Mixer(commands.Cog):
 
         tracks = []
         for track in self.queue:
-            tracks.append((track[1], track[4]))
+            tracks.append((track.title, track.webpage))
 
         async with self.file_lock:
             data = {
@@ -1576,25 +2193,26 @@ class Mixer(commands.Cog):
             errors = []
 
             async with ctx.typing():
-                for query in queries:
-                    try:
-                        query_type = self.get_query_type(query)
-
-                        info = await asyncio.to_thread(self.fetch_track, ctx, query_type, query)
+                results = await self.resolve_queries(ctx, queries)
 
+                for query, info in zip(queries, results):
+                    try:
                         if info == "no_entry":
                             errors.append((f"No entries found for query **{query}**.", "Error: No entry"))
                             continue
                         elif info == "invalid_query":
                             errors.append((f"Invalid query type for query **{query}**.", "Error: Invalid query"))
                             continue
+                        elif info == "unknown_error":
+                            errors.append((f"**{query}**", "Error: Unknown"))
+                            continue
 
-                        if info:
-                            track_tuple = (info["title"], info["webpage_url"])
-                            new_tracks.append((info["title"], info["webpage_url"]))
+                        for track_info in (info if isinstance(info, list) else [info]): # Playlists resolve to multiple tracks.
+                            track_tuple = (track_info["title"], track_info["webpage_url"])
+                            new_tracks.append((track_info["title"], track_info["webpage_url"]))
                             if track_tuple not in current_playlist:
-                                current_playlist.append((info["title"], info["webpage_url"]))
-                            added_tracks.append(info["title"])
+                                current_playlist.append((track_info["title"], track_info["webpage_url"]))
+                            added_tracks.append(track_info["title"])
                             
                     except Exception as e:
                         errors.append((f"**{query}**", "Error: Unknown"))
@@ -1667,10 +2285,11 @@ class Mixer(commands.Cog):
                     playlist = queue[str(ctx.guild.id)]["queue"]
 
                     if playlist:
-                        for title, webpage in playlist:
-                            if current_track[0].lower().replace(" ", "") == title.lower().replace(" ", ""):
-                                await ctx.send("Current track is already in playlist.")
-                                return
+                        query = normalize_title(current_track[0])
+                        playlist_index = self.get_playlist_index(ctx.guild.id, playlist)
+                        if any(playlist_index.titles[position] == query for position in playlist_index.search(query)):
+                            await ctx.send("Current track is already in playlist.")
+                            return
                             
                         playlist.append(current_track)
                     else:
@@ -1835,11 +2454,12 @@ class Mixer(commands.Cog):
                 return
 
             queue = [] # Create a new queue
+            playlist = data[str(ctx.guild.id)]["queue"]
+            playlist_index = self.get_playlist_index(ctx.guild.id, playlist)
 
             for usr_track in tracks:
-                for track, webpage in data[str(ctx.guild.id)]["queue"]:
-                    if usr_track.lower().replace(" ", "") in track.lower().replace(" ", ""):
-                        queue.append(webpage) # Append the url to the new array.
+                for position in sorted(playlist_index.search(normalize_title(usr_track))): # Matches in playlist order.
+                    queue.append(playlist[position][1]) # Append the url to the new array.
 
             if queue:
                 if ctx.author.voice:
@@ -2053,30 +2673,21 @@ class Mixer(commands.Cog):
 
         self.is_modifying_playlist = False
 
-    def get_track_index(self, queue: list, track: str) -> tuple[int, str]:
-        found = False
-
-        try:
-            for index, (url, title, duration, thumbnail_url, webpage) in enumerate(queue):
-                if track.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                    track_index = index
-                    track_title = title
+    def get_track_index(self, queue: TrackQueue | list, track: str, guild_id: int | None=None) -> tuple[int, str]:
+        """ Returns the index and the title of the first track matching track, guild_id is needed for playlists. """
 
-                    found = True
-                    break
-        except ValueError:
-            for index, (title, url) in enumerate(queue):
-                if track.lower().replace(" ", "") in title.lower().replace(" ", ""):
-                    track_index = index
-                    track_title = title
+        if isinstance(queue, TrackQueue):
+            track_index, queued_track = queue.find(track)
+            if queued_track is None:
+                return (None, None)
 
-                    found = True
-                    break
+            return (track_index, queued_track.title)
 
-        if not found:
+        track_index = min(self.get_playlist_index(guild_id, queue).search(normalize_title(track)), default=None)
+        if track_index is None:
             return (None, None)
 
-        return (track_index, track_title)
+        return (track_index, queue[track_index][0])
 
     @commands.command(name="getindex", help="Outputs the index of the given track in the queue.")
     async def get_index(self, ctx: commands.Context, track: str) -> None:
@@ -2138,7 +2749,7 @@ class Mixer(commands.Cog):
 
         playlist = content[str(ctx.guild.id)]["queue"]
 
-        index, title = self.get_track_index(playlist, track)
+        index, title = self.get_track_index(playlist, track, ctx.guild.id)
 
         if not index and not title:
             await ctx.send(f"Track **{track}** not found in playlist.")
@@ -2173,7 +2784,7 @@ class Mixer(commands.Cog):
 
             if not ctx.voice_client.is_paused() and ctx.voice_client.is_playing():
                 try:
-                    self.last_elapsed_time = int(time.time() - self.start_time)
+                    self.last_elapsed_time = int(self.get_position())
                     
                     embed.add_field(name="Current Track", value=f"{self.data["title"]}", inline=False)
                     embed.add_field(name="Track duration", value=f"{format_time(self.data["duration"])} Minutes", inline=True)
@@ -2185,7 +2796,7 @@ class Mixer(commands.Cog):
                         embed.add_field(name="Next Track", value="Randomized", inline=False)
                     else:
                         if len(self.queue) > 0:
-                            embed.add_field(name="Next Track", value=f"{self.queue[0][1]}", inline=False)
+                            embed.add_field(name="Next Track", value=f"{self.queue[0].title}", inline=False)
                         else:
                             embed.add_field(name="Next Track", value="None", inline=False)
                     
@@ -2213,7 +2824,7 @@ class Mixer(commands.Cog):
                         embed.add_field(name="Next Track", value=f"{self.data["title"]} (looping)", inline=False)
                     else:
                         if len(self.queue) > 0:
-                            embed.add_field(name="Next Track", value=f"{self.queue[0][1]}", inline=False)
+                            embed.add_field(name="Next Track", value=f"{self.queue[0].title}", inline=False)
                         else:
                             embed.add_field(name="Next Track", value="None", inline=False)
                     
@@ -2233,6 +2844,37 @@ class Mixer(commands.Cog):
             await ctx.send("I'm not in any voice channel!")
             return
 
+    @commands.command(name="stats", help="Outputs the FFmpeg processes started for playback and their resource usage.")
+    async def stats(self, ctx: commands.Context) -> None:
+        """ Reports the supervisor's process counts and resource totals, for operators. """
+
+        meets_role_requirement = await self.check_for_role(ctx, REQUIRED_ROLE_NAME)
+        if meets_role_requirement == False:
+            await ctx.send("You do not have the required role to use this command.")
+            return
+
+        await asyncio.to_thread(self.supervisor.sample) # Report current numbers instead of the last periodic sample.
+        stats = self.supervisor.get_stats()
+        shared_stats = self.shared_sources.get_stats()
+
+        embed = discord.Embed(
+            title="Playback processes",
+            colour=discord.Colour.random(seed=random.randint(1, 1000)),
+            timestamp=datetime.now()
+        )
+
+        embed.add_field(name="FFmpeg processes", value=f"{stats["ffmpeg"]} running, {stats["spawned"]["ffmpeg"]} started", inline=True)
+        embed.add_field(name="ffprobe processes", value=f"{stats["ffprobe"]} running, {stats["spawned"]["ffprobe"]} started", inline=True)
+        embed.add_field(name="Loudness analyses", value=f"{stats["analysis"]} running, {stats["spawned"]["analysis"]} started", inline=True)
+        embed.add_field(name="Orphans killed", value=f"{stats["reaped"]}", inline=True)
+        embed.add_field(name="Shared tracks", value=f"{shared_stats["upstreams"]} tracks, {shared_stats["subscribers"]} listeners, {shared_stats["bytes"] / (1024 * 1024):.1f} MB buffered", inline=True)
+        if stats["backend"] != "unavailable":
+            embed.add_field(name="CPU usage", value=f"{stats["cpu_percent"]:.1f}% now, {stats["cpu_time"]:.1f}s total", inline=True)
+            embed.add_field(name="Memory usage", value=f"{stats["rss"] / (1024 * 1024):.1f} MB", inline=True)
+        embed.set_footer(text=f"Resource accounting: {stats["backend"]}")
+
+        await ctx.send(embed=embed)
+
     @commands.command(name="bitrate", help="Outputs the bitrate of the channel the bot's currently in.")
     async def get_channel_bitrate(self, ctx: commands.Context):
         meets_role_requirement = await self.check_for_role(ctx, REQUIRED_ROLE_NAME)
@@ -2264,7 +2906,7 @@ class Mixer(commands.Cog):
             try:
                 query_type = self.get_query_type(query)
                 
-                info = await asyncio.to_thread(self.fetch_track, ctx, query_type, query)
+                info = await asyncio.to_thread(self.fetch_track, ctx, query_type, query, False) # ytsearch needs the full info dictionary, which isn't cached.
 
                 if info == "no_entry":
                     await ctx.send(f"No entries found for query **{query}**.")
@@ -2323,8 +2965,8 @@ class Mixer(commands.Cog):
             embed.add_field(name=f"{COMMAND_PREFIX}join", value="Requests the bot to join your voice channel.\nRequires the user to be in a channel and the bot in none.", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}leave", value="Requests the bot to leave the current voice channel.", inline=False)
             embed.add_field(name=r"**Player management commands**", value="", inline=False)
-            embed.add_field(name=f"{COMMAND_PREFIX}add **<*queries>**", value=f"Adds a track to the queue.\nProvide a search query or a YouTube URL.\nMultiple queries are supported in a single command.\nEach query **must** be enclosed in double quotes.\n(ex. {COMMAND_PREFIX}add \"C418 Haunt Muskie\" \"Resurrections Lena Raine\")\nTip: When using a standard search query, add as much **detail** as possible to get the best result, as the bot gets the first search result.", inline=False)
-            embed.add_field(name=f"{COMMAND_PREFIX}playnow **<query>**", value=f"Stops any track playing and plays a track extracted from the user query.\nTrack is temporary, it is not saved in the queue.\nThe previous track is re-added at the first index of the queue.\nQuery must be enclosed in double quotes.\nex. {COMMAND_PREFIX}playnow \"<trackname>\".", inline=False)
+            embed.add_field(name=f"{COMMAND_PREFIX}add **<*queries>**", value=f"Adds a track to the queue.\nProvide a search query or a YouTube URL.\nYouTube playlist and mix URLs add every track in the playlist.\nMultiple queries are supported in a single command.\nEach query **must** be enclosed in double quotes.\n(ex. {COMMAND_PREFIX}add \"C418 Haunt Muskie\" \"Resurrections Lena Raine\")\nTip: When using a standard search query, add as much **detail** as possible to get the best result, as the bot gets the first search result.", inline=False)
+            embed.add_field(name=f"{COMMAND_PREFIX}playnow **<query>**", value=f"Stops any track playing and plays a track extracted from the user query.\nTrack is temporary, it is not saved in the queue.\nThe previous track is re-added at the first index of the queue.\nA playlist or mix URL plays its first track.\nQuery must be enclosed in double quotes.\nex. {COMMAND_PREFIX}playnow \"<trackname>\".", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}pause", value="Pauses the player.", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}resume", value="Resumes the player.", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}stop", value="Stops the current track and resets the bot's state to its defaults (join state).", inline=False)
@@ -2340,7 +2982,7 @@ class Mixer(commands.Cog):
             embed.add_field(name=r"**Track and queue information commands**", value="", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}nowplaying", value="Shows information about the current track, full queue, and more all in an embedded message.", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}list", value="Lists all the tracks in the queue.", inline=False)
-            embed.add_field(name=f"{COMMAND_PREFIX}history", value="Lists all previously played tracks.", inline=False)
+            embed.add_field(name=f"{COMMAND_PREFIX}history **<page>**", value=f"Lists the previously played tracks, most recent first, {HISTORY_PAGE_SIZE} per page.\nProvide an optional **page** number, the first page is shown by default.\nOnly the last {HISTORY_MAX_ENTRIES} tracks are kept, a replayed track moves to the top.\n(ex. {COMMAND_PREFIX}history **2**)", inline=False)
             embed.add_field(name=f"{COMMAND_PREFIX}duration", value="Shows the track duration and the elapsed time since the start.", inline=False)
             
             embed1 = discord.Embed(
@@ -2374,6 +3016,7 @@ class Mixer(commands.Cog):
             embed1.add_field(name="Other commands", value="", inline=False)
             embed1.add_field(name=f"{COMMAND_PREFIX}ytsearch", value=f"Searches a video on YouTube and reports information about it in an embedded response.\nRequires a search query or YouTube URL.\n(ex. {COMMAND_PREFIX}ytsearch \"Undertale MEGALOVANIA\" or {COMMAND_PREFIX}ytsearch \"https://www.youtube.com/watch?v=XJ9XtKJHvjQ\")", inline=False)
             embed1.add_field(name=f"{COMMAND_PREFIX}bitrate", value="Outputs the bitrate of the channel the bot is in.", inline=False)
+            embed1.add_field(name=f"{COMMAND_PREFIX}stats", value="Outputs the FFmpeg processes started for playback, their CPU and memory usage and how many orphaned processes were killed.", inline=False)
 
             await ctx.send(embed=embed)
             await ctx.send(embed=embed1)
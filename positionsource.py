@@ -0,0 +1,32 @@
+import discord
+
+""" Playback position tracking.
+The voice client reads one 20 ms frame from its source for every packet it sends, so counting the frames read
+gives the position of what listeners actually heard. Unlike wall-clock time it stops while paused and doesn't count
+the time FFmpeg needs to start or reconnect. """
+
+FRAME_DURATION = discord.opus.Encoder.FRAME_LENGTH / 1000 # Seconds of audio per frame read by the voice client.
+
+class PositionTrackingSource(discord.AudioSource):
+    """ Wraps the source played by the voice client and counts the frames read from it. start is the position
+    in seconds the original source starts at. """
+
+    def __init__(self, original: discord.AudioSource, start: float) -> None:
+        self.original: discord.AudioSource = original
+        self.start: float = start
+        self.frames: int = 0 # Only written by the voice client's player thread.
+
+    def read(self) -> bytes:
+        frame = self.original.read()
+        if frame:
+            self.frames += 1
+        return frame
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+    def get_position(self) -> float:
+        return self.start + self.frames * FRAME_DURATION
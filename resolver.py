@@ -0,0 +1,134 @@
+import re
+import asyncio
+import logging
+import traceback
+from cache import ExtractionCache, SearchCache, get_video_id
+from extractor import Extractor
+
+""" Resolution path shared by every command that turns a query into tracks.
+Kept out of music.py so it can be benchmarked without a bot token or a voice connection (see bench.py). """
+
+YOUTUBE_PLAYLIST_PATTERN = re.compile(r'(https?://)?(www\.|m\.|music\.)?youtube\.com/playlist\?(.*&)?list=([\w-]+)') # Playlist pages, a watch URL with a playlist's list= parameter plays the video it points to.
+YOUTUBE_MIX_PATTERN = re.compile(r'(https?://)?(www\.|m\.|music\.)?(youtube\.com|youtu\.be)/.*[?&]list=(RD[\w-]+)') # Mixes only exist as watch URLs, their list IDs start with "RD".
+YOUTUBE_URL_PATTERN = re.compile(r'(https?://)?(www\.)?(youtube\.com|youtu\.be)/(watch|playlist\?v|list=|embed/|v/|.+\?v=)?([^&=%\?]{11})') # YouTube url pattern
+
+def get_query_type(query: str) -> str: # Returns "std_query" if the query pattern does not match a youtube url's
+    if YOUTUBE_PLAYLIST_PATTERN.match(query) or YOUTUBE_MIX_PATTERN.match(query):
+        return "playlist"
+    if YOUTUBE_URL_PATTERN.match(query):
+        return "url"
+    return "std_query"
+
+class Resolver:
+    """ Resolves queries to track information through the search cache, the extraction cache and an extractor backend. """
+
+    def __init__(self, extractor: Extractor, extraction_cache: ExtractionCache, search_cache: SearchCache, max_concurrent: int) -> None:
+        self.extractor: Extractor = extractor
+        self.extraction_cache: ExtractionCache = extraction_cache
+        self.search_cache: SearchCache = search_cache
+        self.max_concurrent: int = max_concurrent # Maximum amount of extractions started by start_resolving() running at the same time.
+
+    def fetch_track(self, query_type: str, query: str, use_cache: bool=True) -> dict | str:
+        """ Fetches a dictionary containing information about the
+        requested query. Returns "no_entry" if no results can be found, "invalid_query" if the query has an invalid structure.
+        Cached tracks are returned without extracting, pass use_cache=False to get the full info dictionary from the extractor. """
+
+        if query_type == "playlist": # Resolves to a single track. A full extraction of a playlist page would extract every video in it.
+            video_id = get_video_id(query)
+            if video_id: # A mix URL points to the video it starts with.
+                query = f"https://www.youtube.com/watch?v={video_id}"
+            else:
+                tracks = self.fetch_playlist(query)
+                if tracks == "no_entry":
+                    return "no_entry"
+                query = tracks[0]["webpage_url"]
+            query_type = "url"
+
+        if query_type == "std_query":
+            video_id = self.search_cache.get(query)
+            if video_id == "no_entry": # Searched recently without results.
+                return "no_entry"
+            if video_id is not None:
+                query_type, query = "url", f"https://www.youtube.com/watch?v={video_id}" # Known search, extracting the video directly is much faster than searching again.
+
+        if use_cache and query_type == "url":
+            video_id = get_video_id(query)
+            cached = self.extraction_cache.get(video_id) if video_id else None
+
+            if cached is not None:
+                return cached
+
+        if query_type == "std_query":
+            info = self.extractor.extract(f"ytsearch:{query}") # Extract with query
+        elif query_type == "url":
+            info = self.extractor.extract(query) # Extract without query.
+        else:
+            return "invalid_query"
+
+        if not info or "entries" in info and not info["entries"]:
+            if query_type == "std_query":
+                self.search_cache.put(query, None)
+            return "no_entry"
+
+        if info and "entries" in info:
+            info = info["entries"][0]
+
+        if query_type == "std_query" and info.get("id"):
+            self.search_cache.put(query, info["id"])
+        self.extraction_cache.put(info)
+
+        return info
+
+    def fetch_playlist(self, query: str) -> list[dict] | str:
+        """ Lists every track of a playlist or mix URL with a single flat extraction.
+        Entries only contain metadata, their stream URLs are resolved when they are about to play.
+        Returns "no_entry" if the playlist is empty or can't be found. """
+
+        info = self.extractor.extract(query, flat=True)
+
+        if not info or not info.get("entries"):
+            return "no_entry"
+
+        tracks = []
+        for entry in info["entries"]:
+            if not entry or not entry.get("id") or entry.get("title") in (None, "[Private video]", "[Deleted video]"):
+                continue # Unavailable videos are still listed in flat playlists.
+
+            thumbnails = entry.get("thumbnails") or []
+            tracks.append({
+                "id": entry["id"],
+                "title": entry["title"],
+                "duration": int(entry.get("duration") or 0),
+                "thumbnail": thumbnails[-1]["url"] if thumbnails else None, # Last thumbnail is the biggest one.
+                "webpage_url": f"https://www.youtube.com/watch?v={entry['id']}"
+            })
+
+        if not tracks:
+            return "no_entry"
+
+        return tracks
+
+    def start_resolving(self, queries: tuple[str] | list[str]) -> list[asyncio.Task]:
+        """ Starts resolving multiple queries in parallel, running at most max_concurrent extractions at the same time.
+        Returns one task per query, in the same order as the queries. Failed extractions resolve to "unknown_error",
+        playlist queries resolve to a list of tracks. Must be called from the event loop. """
+
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def resolve(query: str) -> dict | list[dict] | str:
+            async with semaphore:
+                try:
+                    query_type = get_query_type(query) # Figure out the query type (std_query, url, playlist)
+                    if query_type == "playlist":
+                        return await asyncio.to_thread(self.fetch_playlist, query) # Returns a list of tracks instead of a single one.
+                    return await asyncio.to_thread(self.fetch_track, query_type, query) # Use to_thread() to avoid blocking code.
+                except Exception:
+                    logging.error(f"An error occured while resolving query \"{query}\" in function start_resolving(); {traceback.format_exc()}")
+                    return "unknown_error"
+
+        return [asyncio.create_task(resolve(query)) for query in queries]
+
+    async def resolve_queries(self, queries: tuple[str] | list[str]) -> list[dict | list[dict] | str]:
+        """ Resolves multiple queries in parallel and waits for all of them. Results keep the order of the queries. """
+
+        return await asyncio.gather(*self.start_resolving(queries))
@@ -0,0 +1,189 @@
+import time
+import threading
+import discord
+
+""" Shared audio sources.
+Voice sessions playing the same track from the same position share one upstream FFmpeg process. Each session gets a
+SharedAudioSource with its own read position over the Opus frames the upstream has produced. """
+
+FRAMES_PER_SECOND = 50 # Discord's Opus frames are 20 ms long.
+
+class Upstream:
+    """ One FFmpeg source and the Opus frames read from it so far. Frames are read on demand by the subscriber furthest ahead,
+    so the upstream never runs ahead of real time. New subscribers can only join during the first join_frames frames, which
+    stay in memory until then. Once the furthest subscriber is past them, only frames some subscriber still has to play are kept. """
+
+    def __init__(self, key: tuple, source: discord.AudioSource, join_frames: int) -> None:
+        self.key: tuple = key
+        self.source: discord.AudioSource = source
+        self.join_frames: int = join_frames
+        self.frames: list[bytes] = []
+        self.offset: int = 0 # Index of frames[0] in the whole stream, grows when old frames are dropped.
+        self.size: int = 0 # Bytes held in frames.
+        self.ended: bool = False
+        self.subscribers: set["SharedAudioSource"] = set()
+        self.released_at: float = 0.0 # When the last subscriber left.
+        self.lock: threading.Lock = threading.Lock() # Every voice client reads from its own player thread.
+
+    def is_joinable(self) -> bool:
+        """ New subscribers start at the first frame, so they can only join within the join window while it's still held. """
+
+        return self.offset == 0 and len(self.frames) <= self.join_frames and self.source is not None
+
+    def read(self, index: int) -> bytes:
+        with self.lock:
+            while index >= self.offset + len(self.frames):
+                if self.ended:
+                    return b""
+
+                frame = self.source.read()
+                if not frame:
+                    self.ended = True
+                    return b""
+
+                self.frames.append(frame)
+                self.size += len(frame)
+
+            frame = self.frames[index - self.offset]
+            if self.offset + len(self.frames) > self.join_frames: # Past the join window, the backlog is only needed by slower subscribers.
+                self.trim()
+            return frame
+
+    def trim(self) -> None:
+        """ Drops frames every subscriber has already played. Called with the lock held. """
+
+        oldest = min((subscriber.position for subscriber in self.subscribers), default=self.offset + len(self.frames))
+        dropped = oldest - self.offset
+        if dropped < 50: # Trim in batches, deleting from the front of a list is linear.
+            return
+
+        self.size -= sum(len(frame) for frame in self.frames[:dropped])
+        del self.frames[:dropped]
+        self.offset = oldest
+
+    def cleanup(self) -> None:
+        with self.lock:
+            if self.source is not None:
+                self.source.cleanup()
+                self.source = None
+            self.frames.clear()
+            self.ended = True
+
+class SharedAudioSource(discord.AudioSource):
+    """ Subscriber of an Upstream, played by a single voice client. """
+
+    def __init__(self, upstream: Upstream, registry: "SharedSourceRegistry") -> None:
+        self.upstream: Upstream = upstream
+        self.registry: "SharedSourceRegistry" = registry
+        self.position: int = 0 # Index of the next frame this subscriber plays.
+        self.closed: bool = False
+
+    def read(self) -> bytes:
+        frame = self.upstream.read(self.position)
+        if frame:
+            self.position += 1
+        return frame
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.registry.release(self)
+
+class SharedSourceRegistry:
+    """ Upstreams keyed by (video ID, seek position, filters). An upstream that's still joinable is kept for linger seconds
+    after its last subscriber leaves, so a track restarted within the join window reuses the frames already in memory. """
+
+    def __init__(self, join_window: float, linger: float) -> None:
+        self.join_frames: int = int(join_window * FRAMES_PER_SECOND)
+        self.linger: float = linger
+        self.upstreams: dict[tuple, Upstream] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def subscribe(self, key: tuple) -> SharedAudioSource | None:
+        """ Returns a new subscriber of the upstream for key, None if there's no upstream new subscribers can join. """
+
+        self.purge()
+        with self.lock:
+            upstream = self.upstreams.get(key)
+            if upstream is None or not upstream.is_joinable():
+                return None
+
+            subscriber = SharedAudioSource(upstream, self)
+            with upstream.lock:
+                upstream.subscribers.add(subscriber)
+            return subscriber
+
+    def publish(self, key: tuple, source: discord.AudioSource) -> SharedAudioSource:
+        """ Registers source as the upstream for key and returns its first subscriber. """
+
+        upstream = Upstream(key, source, self.join_frames)
+        subscriber = SharedAudioSource(upstream, self)
+        upstream.subscribers.add(subscriber)
+
+        with self.lock:
+            replaced = self.upstreams.get(key)
+            self.upstreams[key] = upstream
+        if replaced is not None and not replaced.subscribers: # Replaced upstreams with subscribers are cleaned up by their last subscriber.
+            replaced.cleanup()
+
+        return subscriber
+
+    def release(self, subscriber: SharedAudioSource) -> None:
+        upstream = subscriber.upstream
+        with upstream.lock:
+            upstream.subscribers.discard(subscriber)
+            if upstream.subscribers:
+                return
+            upstream.released_at = time.time()
+
+        with self.lock:
+            registered = self.upstreams.get(upstream.key) is upstream
+        if not registered or not upstream.is_joinable():
+            self.remove(upstream) # Nobody can join it anymore, stop FFmpeg now.
+
+    def remove(self, upstream: Upstream) -> None:
+        with self.lock:
+            if self.upstreams.get(upstream.key) is upstream:
+                del self.upstreams[upstream.key]
+        upstream.cleanup()
+
+    def forget(self, video_id: str) -> None:
+        """ Stops sharing every upstream of a track, used when its stream failed and the frames held are incomplete. """
+
+        with self.lock:
+            forgotten = [upstream for key, upstream in self.upstreams.items() if key[0] == video_id]
+            for upstream in forgotten:
+                del self.upstreams[upstream.key]
+
+        for upstream in forgotten:
+            if not upstream.subscribers: # Upstreams still playing are cleaned up by their last subscriber.
+                upstream.cleanup()
+
+    def purge(self) -> None:
+        """ Removes upstreams that have had no subscribers for linger seconds. """
+
+        with self.lock:
+            expired = [upstream for upstream in self.upstreams.values()
+                       if not upstream.subscribers and time.time() - upstream.released_at > self.linger]
+
+        for upstream in expired:
+            self.remove(upstream)
+
+    def get_sources(self) -> set[discord.AudioSource]:
+        """ Returns the FFmpeg sources of every registered upstream, they must not be treated as orphaned. """
+
+        with self.lock:
+            return {upstream.source for upstream in self.upstreams.values() if upstream.source is not None}
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            upstreams = list(self.upstreams.values())
+
+        return {
+            "upstreams": len(upstreams),
+            "subscribers": sum(len(upstream.subscribers) for upstream in upstreams),
+            "bytes": sum(upstream.size for upstream in upstreams)
+        }
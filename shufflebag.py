@@ -0,0 +1,95 @@
+import random
+from typing import Hashable
+
+""" Random track selection.
+A track played in random mode leaves the queue, so every queued track plays once before the looped queue refills it.
+The bag only has to pick one of the queued tracks: keys live in a list with their positions in a dict, picking is a random index
+and removing swaps the last key into the freed slot, all in constant time. """
+
+class ShuffleBag:
+    """ Keys of the queued tracks, grouped by requester. draw() picks a key with equal probability, draw(by_group=True) first
+    picks a group and then a key in it, so a requester who queued a single track is as likely to be played next as one who queued fifty. """
+
+    def __init__(self) -> None:
+        self.keys: list[Hashable] = []
+        self.positions: dict[Hashable, int] = {} # key -> index in keys
+        self.groups: dict[Hashable, list[Hashable]] = {} # group -> keys in it
+        self.group_positions: dict[Hashable, tuple[Hashable, int]] = {} # key -> (group, index in the group's keys)
+        self.group_names: list[Hashable] = [] # Groups with at least one key, indexed so one can be picked at random.
+        self.group_name_positions: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.positions
+
+    def add(self, key: Hashable, group: Hashable=None) -> None:
+        if key in self.positions:
+            self.remove(key)
+
+        self.positions[key] = len(self.keys)
+        self.keys.append(key)
+
+        keys = self.groups.get(group)
+        if keys is None:
+            keys = self.groups[group] = []
+            self.group_name_positions[group] = len(self.group_names)
+            self.group_names.append(group)
+
+        self.group_positions[key] = (group, len(keys))
+        keys.append(key)
+
+    def remove(self, key: Hashable) -> None:
+        index = self.positions.pop(key, None)
+        if index is None:
+            return
+
+        swap_remove(self.keys, index, self.positions)
+
+        group, index = self.group_positions.pop(key)
+        keys = self.groups[group]
+        last = keys.pop()
+        if index < len(keys):
+            keys[index] = last
+            self.group_positions[last] = (group, index)
+
+        if not keys:
+            del self.groups[group]
+            swap_remove(self.group_names, self.group_name_positions.pop(group), self.group_name_positions)
+
+    def clear(self) -> None:
+        self.keys.clear()
+        self.positions.clear()
+        self.groups.clear()
+        self.group_positions.clear()
+        self.group_names.clear()
+        self.group_name_positions.clear()
+
+    def copy(self) -> "ShuffleBag":
+        bag = ShuffleBag()
+        bag.keys = self.keys.copy()
+        bag.positions = self.positions.copy()
+        bag.groups = {group: keys.copy() for group, keys in self.groups.items()}
+        bag.group_positions = self.group_positions.copy()
+        bag.group_names = self.group_names.copy()
+        bag.group_name_positions = self.group_name_positions.copy()
+        return bag
+
+    def draw(self, by_group: bool=False) -> Hashable | None:
+        """ Returns a random key without removing it, None if the bag is empty. """
+
+        if not self.keys:
+            return None
+        if not by_group:
+            return random.choice(self.keys)
+
+        return random.choice(self.groups[random.choice(self.group_names)])
+
+def swap_remove(items: list, index: int, positions: dict) -> None:
+    """ Removes items[index] by moving the last item into its place, positions maps every item to its index. """
+
+    last = items.pop()
+    if index < len(items):
+        items[index] = last
+        positions[last] = index
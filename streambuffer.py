@@ -0,0 +1,171 @@
+import os
+import re
+import logging
+import tempfile
+import threading
+import traceback
+import urllib.request
+import discord
+from typing import Callable
+from yt_dlp.utils.networking import std_headers
+
+""" Local buffer of the current track's audio.
+The stream is downloaded once to a temporary file in the background and playback reads from that file while the download runs,
+so seek, rewind and forward can start FFmpeg on local data instead of reconnecting to YouTube and reading up to the position again. """
+
+CHUNK_SIZE = 10 * 1024 * 1024 # googlevideo throttles long single requests, so the stream is downloaded in ranges like yt_dlp's http_chunk_size does.
+READ_SIZE = 64 * 1024
+READY_TIMEOUT = 10 # Seconds playback waits for the first response before streaming the URL directly.
+COVER_MARGIN = 5 # Seconds of audio that must be buffered past a seek position before it's served locally.
+CONTENT_RANGE_PATTERN = re.compile(r'bytes \d+-\d+/(\d+)')
+
+class StreamBuffer:
+    """ Downloads a stream URL to a temporary file in a worker thread. Readers returned by open_reader()
+    can start reading before the download finishes, they wait for new data instead of hitting the end of the file. """
+
+    def __init__(self, url: str, webpage: str, duration: int, max_bytes: int, on_complete: Callable[["StreamBuffer"], None] | None=None) -> None:
+        self.url: str = url
+        self.webpage: str = webpage # Identifies the track the buffer belongs to.
+        self.duration: int = duration
+        self.max_bytes: int = max_bytes # Tracks larger than this are not buffered at all.
+        self.size: int = 0 # Total size of the stream in bytes, 0 until the first response arrives.
+        self.downloaded: int = 0
+        self.complete: bool = False
+        self.failed: bool = False
+        self.finished: bool = False # Set once the worker thread stops, whether the download completed or not.
+        self.closed: bool = False
+        self.on_complete: Callable[["StreamBuffer"], None] | None = on_complete # Called from the download thread once the whole stream is in the file.
+        self.condition: threading.Condition = threading.Condition() # Notified whenever new data is written or the download stops.
+
+        fd, self.file_path = tempfile.mkstemp(prefix="musicbot_", suffix=".buffer")
+        self.file = os.fdopen(fd, "wb")
+        self.thread: threading.Thread = threading.Thread(target=self.download, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def get_total_size(self, response) -> int:
+        match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range") or "")
+        if match:
+            return int(match.group(1))
+        return int(response.headers.get("Content-Length") or 0) # The server ignored the range and sent everything.
+
+    def download(self) -> None:
+        try:
+            while not self.closed:
+                request = urllib.request.Request(self.url, headers={**std_headers, "Range": f"bytes={self.downloaded}-{self.downloaded + CHUNK_SIZE - 1}"})
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    if not self.size:
+                        self.size = self.get_total_size(response)
+                        if not self.size or self.size > self.max_bytes:
+                            return # Unknown or too large, playback and seeks in this track keep using the stream.
+                        with self.condition:
+                            self.condition.notify_all() # Wakes up wait_until_ready().
+
+                    while not self.closed:
+                        data = response.read(READ_SIZE)
+                        if not data:
+                            break
+
+                        self.file.write(data)
+                        self.file.flush() # Readers open the file separately, they must see every byte that's counted as downloaded.
+                        with self.condition:
+                            self.downloaded += len(data)
+                            self.condition.notify_all()
+
+                    if response.status == 200 or self.downloaded >= self.size:
+                        self.complete = not self.closed
+                        break
+
+            if self.complete and self.on_complete is not None:
+                self.file.close()
+                self.on_complete(self)
+        except Exception:
+            if not self.closed:
+                self.failed = True
+                logging.error(f"An error occured while buffering stream of \"{self.webpage}\" in function download(); {traceback.format_exc()}")
+        finally:
+            self.file.close()
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def is_usable(self) -> bool:
+        return bool(self.size) and self.size <= self.max_bytes and not self.failed and not self.closed
+
+    def wait_until_ready(self, timeout: float=READY_TIMEOUT) -> bool:
+        """ Waits for the first response and returns True if playback can read from the buffer. Blocking, run it in a worker thread. """
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.size or self.finished or self.closed, timeout)
+            return self.is_usable()
+
+    def covers(self, seconds: int) -> bool:
+        """ Returns True if the audio at position seconds is, or will soon be, available locally.
+        The byte offset of a position is estimated from the track's duration, which is close enough for Opus and AAC streams. """
+
+        if self.failed or self.closed or not self.size:
+            return False
+        if self.complete:
+            return True
+
+        return self.downloaded / self.size * self.duration > seconds + COVER_MARGIN
+
+    def open_reader(self) -> "BufferReader":
+        return BufferReader(self)
+
+    def close(self) -> None:
+        """ Stops the download, wakes up waiting readers and deletes the temporary file. """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        try:
+            os.remove(self.file_path)
+        except OSError:
+            logging.warning(f"Failed to delete stream buffer \"{self.file_path}\" in function close(); {traceback.format_exc()}")
+
+class BufferReader:
+    """ File-like reader over a StreamBuffer, passed to FFmpeg through its stdin or read by the demuxer while the download is still running. """
+
+    def __init__(self, buffer: StreamBuffer) -> None:
+        self.buffer: StreamBuffer = buffer
+        self.file = open(buffer.file_path, "rb")
+
+    def read(self, size: int=-1) -> bytes:
+        try:
+            while True:
+                data = self.file.read(size)
+                if data:
+                    return data
+
+                with self.buffer.condition:
+                    if self.buffer.finished or self.buffer.closed:
+                        data = self.file.read(size) # Data written between the read above and the check.
+                        if not data:
+                            self.close()
+                        return data
+                    self.buffer.condition.wait(1) # Timeout so a reader never waits forever on a stalled download.
+        except ValueError: # Closed by cleanup while FFmpeg's writer thread was waiting for data.
+            return b""
+
+    def seek(self, offset: int, whence: int=os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def close(self) -> None:
+        self.file.close()
+
+class BufferedOpusAudio(discord.FFmpegOpusAudio):
+    """ FFmpegOpusAudio fed from a BufferReader. The reader is only closed by itself at the end of the buffer,
+    so it's also closed here when FFmpeg is killed early (skip, stop, seek). """
+
+    def __init__(self, reader: BufferReader, **kwargs) -> None:
+        self.reader: BufferReader = reader
+        super().__init__(reader, pipe=True, **kwargs)
+
+    def cleanup(self) -> None:
+        try:
+            super().cleanup()
+        finally:
+            self.reader.close()
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import logging
+import threading
+import traceback
+import subprocess
+import discord
+
+try:
+    import psutil # Optional, used for resource accounting where /proc isn't available.
+except ImportError:
+    psutil = None
+
+""" Supervision of the FFmpeg and ffprobe processes started for playback.
+Every process is registered when it's spawned, its CPU time and memory are sampled periodically,
+and FFmpeg processes whose audio source is no longer attached to a voice client are killed. """
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def get_accounting_backend() -> str:
+    if psutil is not None:
+        return "psutil"
+    if os.path.exists("/proc/self/stat"):
+        return "/proc"
+    return "unavailable"
+
+def read_usage(pid: int) -> tuple[float, int] | None:
+    """ Returns the CPU seconds (user + system) and resident memory in bytes of a process, None if it can't be read. """
+
+    try:
+        if psutil is not None:
+            process = psutil.Process(pid)
+            cpu_times = process.cpu_times()
+            return cpu_times.user + cpu_times.system, process.memory_info().rss
+
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split() # The command name can contain spaces, fields start after it.
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, resident_pages * PAGE_SIZE # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    except Exception: # The process exited between the check and the read, or there's no way to read it on this platform.
+        return None
+
+class SupervisedProcess:
+    """ A registered process and its last resource sample. """
+
+    def __init__(self, process: subprocess.Popen, kind: str, source: discord.AudioSource | None) -> None:
+        self.process: subprocess.Popen = process
+        self.kind: str = kind # "ffmpeg", "ffprobe" or "analysis"
+        self.source: discord.AudioSource | None = source # Audio source owning the process, None for ffprobe.
+        self.started: float = time.time()
+        self.cpu_time: float = 0.0 # CPU seconds used so far.
+        self.cpu_percent: float = 0.0 # CPU usage between the last two samples.
+        self.rss: int = 0
+        self.sampled_at: float = time.time()
+
+class ProcessSupervisor:
+    """ Keeps track of playback processes. sample() and probe() run in worker threads, reap() runs on the event loop. """
+
+    def __init__(self, grace_period: float, probe_timeout: float) -> None:
+        self.grace_period: float = grace_period # Seconds a new FFmpeg process may stay detached, sources are created before they're played.
+        self.probe_timeout: float = probe_timeout
+        self.processes: dict[int, SupervisedProcess] = {} # pid -> process
+        self.lock: threading.Lock = threading.Lock()
+        self.spawned: dict[str, int] = {"ffmpeg": 0, "ffprobe": 0, "analysis": 0}
+        self.reaped: int = 0 # FFmpeg processes killed because nothing was playing them.
+        self.exited_cpu_time: float = 0.0 # CPU seconds of processes that already exited.
+
+    def register(self, process: subprocess.Popen, kind: str, source: discord.AudioSource | None=None) -> None:
+        with self.lock:
+            self.processes[process.pid] = SupervisedProcess(process, kind, source)
+            self.spawned[kind] += 1
+
+    def unregister(self, process: subprocess.Popen) -> None:
+        with self.lock:
+            entry = self.processes.pop(process.pid, None)
+            if entry is not None:
+                self.exited_cpu_time += entry.cpu_time
+
+    def register_source(self, source: discord.FFmpegAudio) -> discord.FFmpegAudio:
+        """ Registers the FFmpeg process of an audio source, returns the source so it can wrap a constructor call. """
+
+        process = getattr(source, "_process", None) # discord.py doesn't expose the Popen object publicly.
+        if isinstance(process, subprocess.Popen):
+            self.register(process, "ffmpeg", source)
+
+        return source
+
+    def probe(self, source: str, executable: str="ffmpeg") -> tuple[str | None, int | None]:
+        """ Returns the codec and bitrate of source like discord.py's native probe method, but the ffprobe process is registered
+        while it runs and killed after probe_timeout seconds. Raises on failure, callers pick the codec themselves instead of
+        letting FFmpegOpusAudio.from_probe() fall back to an unsupervised FFmpeg. Blocking, run it in a worker thread. """
+
+        exe = executable[:2] + "probe" if executable in ("ffmpeg", "avconv") else executable
+        process = subprocess.Popen([exe, "-v", "quiet", "-print_format", "json", "-show_streams", "-select_streams", "a:0", source], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.register(process, "ffprobe")
+
+        try:
+            output, _ = process.communicate(timeout=self.probe_timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            self.unregister(process)
+
+        if not output:
+            return None, None
+
+        stream = json.loads(output)["streams"][0]
+        bitrate = int(stream.get("bit_rate", 0))
+        return stream.get("codec_name"), min(round(bitrate / 1000), 512) or None
+
+    def run(self, args: list[str], timeout: float, kind: str="analysis") -> bytes:
+        """ Runs an FFmpeg process that isn't an audio source (loudness analysis) and returns its stderr. The process is registered
+        while it runs, so it's sampled and counted, and killed after timeout seconds. reap() leaves it alone, it isn't meant to be played. """
+
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.register(process, kind)
+
+        try:
+            _, output = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        finally:
+            self.unregister(process)
+
+        return output
+
+    def sample(self) -> None:
+        """ Updates the resource usage of every process and forgets the ones that exited. """
+
+        with self.lock:
+            entries = list(self.processes.values())
+
+        for entry in entries:
+            if entry.process.poll() is not None:
+                self.unregister(entry.process)
+                continue
+
+            usage = read_usage(entry.process.pid)
+            if usage is None:
+                continue
+
+            now = time.time()
+            cpu_time, entry.rss = usage
+            entry.cpu_percent = (cpu_time - entry.cpu_time) / max(now - entry.sampled_at, 1e-6) * 100
+            entry.cpu_time, entry.sampled_at = cpu_time, now
+
+    def reap(self, live_sources: set[discord.AudioSource]) -> int:
+        """ Kills FFmpeg processes whose source isn't in live_sources (playing on a voice client or prepared for gapless playback).
+        Returns the amount of processes killed. """
+
+        with self.lock:
+            orphans = [entry for entry in self.processes.values()
+                       if entry.kind == "ffmpeg" and entry.source not in live_sources and time.time() - entry.started > self.grace_period]
+
+        killed = 0
+        for entry in orphans:
+            if entry.process.poll() is None:
+                logging.warning(f"Killing orphaned FFmpeg process {entry.process.pid} in function reap(), its audio source is not attached to any voice client.")
+                try:
+                    entry.source.cleanup() # Kills the process and closes its pipes.
+                except Exception:
+                    logging.error(f"Failed to clean up audio source of process {entry.process.pid} in function reap(); {traceback.format_exc()}")
+                    entry.process.kill()
+                killed += 1
+            self.unregister(entry.process)
+
+        with self.lock:
+            self.reaped += killed
+        return killed
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            entries = list(self.processes.values())
+
+            return {
+                "backend": get_accounting_backend(),
+                "ffmpeg": sum(1 for entry in entries if entry.kind == "ffmpeg"),
+                "ffprobe": sum(1 for entry in entries if entry.kind == "ffprobe"),
+                "analysis": sum(1 for entry in entries if entry.kind == "analysis"),
+                "spawned": dict(self.spawned),
+                "reaped": self.reaped,
+                "cpu_percent": sum(entry.cpu_percent for entry in entries),
+                "cpu_time": self.exited_cpu_time + sum(entry.cpu_time for entry in entries),
+                "rss": sum(entry.rss for entry in entries)
+            }
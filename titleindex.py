@@ -0,0 +1,69 @@
+from typing import Hashable
+
+""" Substring search over track titles.
+Titles are stored normalized (see tracks.normalize_title()) and every trigram of a title points to the entries containing it.
+A lookup intersects the posting sets of the query's trigrams, starting with the smallest, and only checks the
+few remaining candidates with a substring test, instead of normalizing and testing every title. """
+
+GRAM_SIZE = 3
+
+def get_grams(text: str) -> set[str]:
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+class TitleIndex:
+    """ Trigram index from normalized titles to entry keys. Keys are chosen by the owner: TrackQueue uses the
+    identity of its tracks, saved playlists use positions. """
+
+    def __init__(self) -> None:
+        self.titles: dict[Hashable, str] = {} # key -> normalized title
+        self.postings: dict[str, set[Hashable]] = {} # trigram -> keys of the titles containing it
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def add(self, key: Hashable, title: str) -> None:
+        if key in self.titles:
+            self.remove(key)
+
+        self.titles[key] = title
+        for gram in get_grams(title):
+            self.postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key: Hashable) -> None:
+        title = self.titles.pop(key, None)
+        if title is None:
+            return
+
+        for gram in get_grams(title):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def clear(self) -> None:
+        self.titles.clear()
+        self.postings.clear()
+
+    def copy(self) -> "TitleIndex":
+        index = TitleIndex()
+        index.titles = self.titles.copy()
+        index.postings = {gram: keys.copy() for gram, keys in self.postings.items()}
+        return index
+
+    def search(self, query: str) -> set[Hashable]:
+        """ Returns the keys of every title containing query, which must already be normalized. """
+
+        if len(query) < GRAM_SIZE: # Too short to have a trigram, every title has to be checked.
+            return {key for key, title in self.titles.items() if query in title}
+
+        postings = sorted((self.postings.get(gram, ()) for gram in get_grams(query)), key=len)
+        if not postings[0]:
+            return set()
+
+        candidates = set(postings[0])
+        for keys in postings[1:]:
+            candidates &= keys
+            if not candidates:
+                return candidates
+
+        return {key for key in candidates if query in self.titles[key]} # Trigrams can match out of order, confirm the substring.
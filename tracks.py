@@ -0,0 +1,234 @@
+from bisect import bisect_left
+from collections import deque
+from typing import Iterable, Iterator
+from titleindex import TitleIndex
+from shufflebag import ShuffleBag
+
+""" Queue entries and the queue holding them.
+A Track stores what's known about a queued track before it plays, the stream URL is resolved just in time.
+TrackQueue keeps them in a deque, so play_next() takes the head and add appends in constant time,
+indexes their titles so lookups by name don't scan the queue and keeps them in a shuffle bag for random mode. """
+
+def normalize_title(text: str) -> str:
+    """ Lowercases text and removes its spaces, every title lookup (select, remove, reposition, getindex) compares this form. """
+
+    return text.lower().replace(" ", "")
+
+class Track:
+    """ A queued track. Two tracks are equal when all their fields but requester are, like the tuples they replace. """
+
+    __slots__ = ("title", "duration", "thumbnail_url", "webpage", "requester", "normalized_title")
+
+    def __init__(self, title: str, duration: int, thumbnail_url: str | None, webpage: str, requester: int | None=None) -> None:
+        self.title: str = title
+        self.duration: int = duration
+        self.thumbnail_url: str | None = thumbnail_url
+        self.webpage: str = webpage
+        self.requester: int | None = requester # ID of the member who queued the track, None if unknown.
+        self.normalized_title: str = normalize_title(title) # Computed once instead of on every lookup.
+
+    def get_key(self) -> tuple:
+        return (self.title, self.duration, self.thumbnail_url, self.webpage)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        return (isinstance(other, Track) and self.webpage == other.webpage and self.title == other.title
+                and self.duration == other.duration and self.thumbnail_url == other.thumbnail_url) # Field by field, deque.index() compares a lot of tracks.
+
+    def __hash__(self) -> int:
+        return hash(self.get_key())
+
+    def __repr__(self) -> str:
+        return f"Track({self.title!r}, {self.webpage!r})"
+
+    def copy(self) -> "Track":
+        return Track(self.title, self.duration, self.thumbnail_url, self.webpage, self.requester)
+
+class TrackQueue:
+    """ Ordered tracks backed by a deque. Appends and pops at either end are amortized O(1), indexed access, pop(index),
+    insert() and move() are O(n) in the distance to the nearest end, plus a memmove of the order key list.
+    Every track also has an order key that grows from head to tail. The keys are kept in a sorted list next to the deque,
+    so a track's position is a binary search instead of a walk over the queue. The list starts at order_start: popping the head
+    only moves that offset and the freed slots are dropped in one go once they make up half the list. A Track object is held at most once,
+    adding one that's already queued adds a copy, so the object identifies the entry: membership, index() and remove()
+    look for that entry, not for an equal track. """
+
+    __slots__ = ("tracks", "members", "orders", "order_keys", "order_start", "title_index", "shuffle_bag")
+
+    def __init__(self, tracks: Iterable[Track]=()) -> None:
+        self.tracks: deque[Track] = deque()
+        self.members: dict[int, Track] = {} # id(track) -> track
+        self.orders: dict[int, float] = {} # id(track) -> order key
+        self.order_keys: list[float] = [] # Order keys of the tracks, in queue order, from order_start on.
+        self.order_start: int = 0 # Index of the head's order key, slots before it belong to popped tracks.
+        self.title_index: TitleIndex = TitleIndex() # Keyed by id(track).
+        self.shuffle_bag: ShuffleBag = ShuffleBag() # Keyed by id(track), grouped by requester.
+        self.extend(tracks)
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def __iter__(self) -> Iterator[Track]:
+        return iter(self.tracks)
+
+    def __contains__(self, track: Track) -> bool:
+        return self.members.get(id(track)) is track
+
+    def __getitem__(self, index: int | slice) -> Track | list[Track]:
+        if isinstance(index, slice):
+            return list(self.tracks)[index]
+        return self.tracks[index]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, TrackQueue):
+            return self.tracks == other.tracks
+        if isinstance(other, list):
+            return list(self.tracks) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TrackQueue({list(self.tracks)!r})"
+
+    def add_member(self, track: Track, order: float) -> Track:
+        if id(track) in self.members:
+            track = track.copy()
+
+        self.members[id(track)] = track
+        self.orders[id(track)] = order
+        self.title_index.add(id(track), track.normalized_title)
+        self.shuffle_bag.add(id(track), track.requester)
+        return track
+
+    def remove_member(self, track: Track) -> None:
+        del self.members[id(track)]
+        del self.orders[id(track)]
+        self.title_index.remove(id(track))
+        self.shuffle_bag.remove(id(track))
+
+    def renumber(self) -> None:
+        """ Spreads the order keys out again once repeated inserts in the same gap ran out of float precision. """
+
+        for position, track in enumerate(self.tracks):
+            self.orders[id(track)] = float(position)
+        self.order_keys = [float(position) for position in range(len(self.tracks))]
+        self.order_start = 0
+
+    def append(self, track: Track) -> None:
+        order = self.order_keys[-1] + 1 if self.tracks else 0.0
+        self.tracks.append(self.add_member(track, order))
+        self.order_keys.append(order)
+
+    def extend(self, tracks: Iterable[Track]) -> None:
+        for track in tracks:
+            self.append(track)
+
+    def insert(self, index: int, track: Track) -> None:
+        if index >= len(self.tracks) or not self.tracks:
+            self.append(track)
+            return
+        if index <= 0:
+            order = self.order_keys[self.order_start] - 1
+            self.tracks.appendleft(self.add_member(track, order))
+            if self.order_start > 0: # Reuse the slot of the last popped head.
+                self.order_start -= 1
+                self.order_keys[self.order_start] = order
+            else:
+                self.order_keys.insert(0, order)
+            return
+
+        before, after = self.order_keys[self.order_start + index - 1], self.order_keys[self.order_start + index]
+        if not before < (before + after) / 2 < after:
+            self.renumber()
+            before, after = index - 1, index
+        order = (before + after) / 2
+
+        self.tracks.insert(index, self.add_member(track, order))
+        self.order_keys.insert(self.order_start + index, order)
+
+    def pop(self, index: int=0) -> Track:
+        """ Removes and returns the track at index, the head by default. """
+
+        if index < 0:
+            index += len(self.tracks)
+
+        if index == 0:
+            track = self.tracks.popleft()
+            self.order_start += 1
+            if self.order_start * 2 >= len(self.order_keys): # Amortized over the pops that freed the slots.
+                del self.order_keys[:self.order_start]
+                self.order_start = 0
+        elif index == len(self.tracks) - 1:
+            track = self.tracks.pop()
+            self.order_keys.pop()
+        else:
+            track = self.tracks[index]
+            del self.tracks[index]
+            del self.order_keys[self.order_start + index]
+
+        self.remove_member(track)
+        return track
+
+    def move(self, index: int, new_index: int) -> Track:
+        """ Moves the track at index to new_index and returns it. """
+
+        track = self.pop(index)
+        self.insert(new_index, track)
+        return track
+
+    def index(self, track: Track) -> int:
+        if track not in self:
+            raise ValueError(f"{track!r} is not in queue")
+        return self.get_position(track)
+
+    def remove(self, track: Track) -> None:
+        self.pop(self.index(track))
+
+    def clear(self) -> None:
+        self.tracks.clear()
+        self.members.clear()
+        self.orders.clear()
+        self.order_keys.clear()
+        self.order_start = 0
+        self.title_index.clear()
+        self.shuffle_bag.clear()
+
+    def get_position(self, track: Track) -> int:
+        """ Returns the index of this exact track object, which must be queued. """
+
+        return bisect_left(self.order_keys, self.orders[id(track)], self.order_start) - self.order_start
+
+    def take(self, track: Track | None) -> Track | None:
+        """ Removes and returns this exact track object, None if it's not queued. Equal tracks queued before it stay. """
+
+        if track is None or self.members.get(id(track)) is not track:
+            return None
+        return self.pop(self.get_position(track))
+
+    def pick_random(self, by_requester: bool=False) -> Track | None:
+        """ Returns a random queued track without removing it, see ShuffleBag.draw(). """
+
+        key = self.shuffle_bag.draw(by_group=by_requester)
+        return self.members[key] if key is not None else None
+
+    def find(self, query: str) -> tuple[int, Track] | tuple[None, None]:
+        """ Returns the position and the track of the first track whose title contains query, compared the way normalize_title() does. """
+
+        keys = self.title_index.search(normalize_title(query))
+        if not keys:
+            return None, None
+
+        track = self.members[min(keys, key=self.orders.__getitem__)]
+        return self.get_position(track), track
+
+    def copy(self) -> "TrackQueue":
+        """ Returns a queue holding the same Track objects, its indexes are cloned instead of rebuilt. """
+
+        queue = TrackQueue()
+        queue.tracks = self.tracks.copy()
+        queue.members = self.members.copy()
+        queue.orders = self.orders.copy()
+        queue.order_keys = self.order_keys[self.order_start:]
+        queue.title_index = self.title_index.copy()
+        queue.shuffle_bag = self.shuffle_bag.copy()
+        return queue
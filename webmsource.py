@@ -0,0 +1,468 @@
+import os
+import queue
+import logging
+import threading
+import traceback
+import http.client
+from urllib.parse import urlsplit
+import discord
+from yt_dlp.utils.networking import std_headers
+
+""" In-process playback of Opus-in-WebM streams.
+YouTube's Opus formats are WebM files holding 20 ms Opus packets, which is exactly what Discord expects. WebMOpusSource reads
+the Matroska structure itself and hands the packets to the voice client, so no FFmpeg process is needed at all. """
+
+EBML_HEADER = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+CODEC_ID = 0x86
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_CLUSTER_POSITION = 0xF1
+CLUSTER = 0x1F43B675
+TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+
+UNKNOWN_SIZE = -1
+CHUNK_SIZE = 10 * 1024 * 1024 # Same ranged download size as the stream buffer, googlevideo throttles longer requests.
+QUEUE_SIZE = 500 # Packets demuxed ahead of playback, 10 seconds of audio.
+READ_TIMEOUT = 10 # Seconds read() waits for a packet before treating the stream as ended.
+POOL_SIZE = 4 # Idle connections kept per host.
+HTTP_TIMEOUT = 10
+
+class DemuxError(Exception):
+    """ Raised when a stream can't be played by WebMOpusSource, callers fall back to FFmpeg. """
+
+def get_opus_packet_duration(packet: bytes) -> float:
+    """ Returns the duration of an Opus packet in milliseconds, read from its TOC byte (RFC 6716, section 3.1). """
+
+    config = packet[0] >> 3
+    if config < 12:
+        frame_duration = (10, 20, 40, 60)[config % 4] # SILK
+    elif config < 16:
+        frame_duration = (10, 20)[config % 2] # Hybrid
+    else:
+        frame_duration = (2.5, 5, 10, 20)[config % 4] # CELT
+
+    code = packet[0] & 0x03
+    frames = (1, 2, 2)[code] if code < 3 else packet[1] & 0x3F
+    return frame_duration * frames
+
+class ConnectionPool:
+    """ Keep-alive HTTP connections per host, so seeking and chunked downloads don't open a new TLS connection every time. """
+
+    def __init__(self, size: int=POOL_SIZE, timeout: float=HTTP_TIMEOUT) -> None:
+        self.size: int = size
+        self.timeout: float = timeout
+        self.idle: dict[str, queue.LifoQueue] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str) -> http.client.HTTPConnection:
+        with self.lock:
+            idle = self.idle.setdefault(f"{scheme}://{host}", queue.LifoQueue())
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            return connection_class(host, timeout=self.timeout)
+
+    def release(self, scheme: str, host: str, connection: http.client.HTTPConnection) -> None:
+        """ Only call this after the whole response was read, a connection with unread data can't be reused. """
+
+        idle = self.idle[f"{scheme}://{host}"]
+        if idle.qsize() < self.size:
+            idle.put(connection)
+        else:
+            connection.close()
+
+    def request_range(self, url: str, start: int, end: int) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        for attempt in range(2): # An idle connection might have been closed by the server, retry once on a fresh one.
+            connection = self.acquire(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers={**std_headers, "Range": f"bytes={start}-{end}"})
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if attempt:
+                    raise
+                continue
+
+            if response.status not in (200, 206):
+                connection.close()
+                raise DemuxError(f"Unexpected HTTP status {response.status}")
+            return connection, response
+
+class RangeReader:
+    """ Sequential reader over a URL starting at a byte offset, downloaded in CHUNK_SIZE ranges through a ConnectionPool.
+    Local paths (audio cache, stream buffer) are read from disk. A StreamBuffer that is still downloading is read through
+    its BufferReader when its download already reached start, the reader waits for the rest. Offsets past the download use the URL. """
+
+    def __init__(self, url: str, start: int, pool: ConnectionPool, buffer=None) -> None:
+        self.url: str = url
+        self.position: int = start
+        self.pool: ConnectionPool = pool
+        self.local: bool = not url.startswith(("http://", "https://"))
+        self.file = None
+        self.connection: http.client.HTTPConnection | None = None
+        self.response: http.client.HTTPResponse | None = None
+        self.size: int = 0 # Total size of the stream, 0 until known.
+
+        if buffer is not None and buffer.is_usable() and start <= buffer.downloaded: # The download is sequential, the data at start is there or next.
+            self.local = True
+            self.file = buffer.open_reader()
+            self.file.seek(start)
+            self.size = buffer.size
+        elif self.local:
+            self.file = open(url, "rb")
+            self.file.seek(start)
+            self.size = os.path.getsize(url)
+
+    def next_chunk(self) -> bool:
+        if self.size and self.position >= self.size:
+            return False
+
+        self.connection, self.response = self.pool.request_range(self.url, self.position, self.position + CHUNK_SIZE - 1)
+        content_range = self.response.getheader("Content-Range") or ""
+        if "/" in content_range:
+            self.size = int(content_range.rsplit("/", 1)[1])
+        elif self.response.status == 200:
+            self.size = int(self.response.getheader("Content-Length") or 0)
+            self.response.read(self.position) # The server ignored the range, skip to the position.
+
+        return True
+
+    def read(self, size: int) -> bytes:
+        """ Returns exactly size bytes, fewer only at the end of the stream. """
+
+        if self.local:
+            data = b""
+            while len(data) < size: # A BufferReader returns what's downloaded so far.
+                part = self.file.read(size - len(data))
+                if not part:
+                    break
+                data += part
+            self.position += len(data)
+            return data
+
+        data = b""
+        while len(data) < size:
+            if self.response is None and not self.next_chunk():
+                break
+
+            part = self.response.read(size - len(data))
+            if not part: # End of the chunk, the connection can serve the next range.
+                parts = urlsplit(self.url)
+                self.pool.release(parts.scheme, parts.netloc, self.connection)
+                self.connection = self.response = None
+                continue
+
+            data += part
+            self.position += len(part)
+
+        return data
+
+    def skip(self, size: int) -> None:
+        if self.local:
+            self.file.seek(size, os.SEEK_CUR)
+            self.position += size
+            return
+
+        while size > 0:
+            data = self.read(min(size, 64 * 1024))
+            if not data:
+                break
+            size -= len(data)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        if self.connection is not None:
+            self.connection.close() # Part of the response is unread, the connection can't be reused.
+            self.connection = self.response = None
+
+def read_vint(reader: RangeReader, keep_marker: bool) -> tuple[int, int]:
+    """ Reads an EBML variable length integer, returns its value and length. Element IDs keep their length marker,
+    sizes don't. Raises EOFError at the end of the stream. """
+
+    first = reader.read(1)
+    if not first:
+        raise EOFError
+
+    length = 1
+    while length <= 8 and not first[0] & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise DemuxError("Invalid EBML variable length integer")
+
+    value = first[0] if keep_marker else first[0] & (0xFF >> length)
+    for byte in reader.read(length - 1):
+        value = (value << 8) | byte
+
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return UNKNOWN_SIZE, length
+    return value, length
+
+def read_element_header(reader: RangeReader) -> tuple[int, int]:
+    element_id, _ = read_vint(reader, keep_marker=True)
+    size, _ = read_vint(reader, keep_marker=False)
+    return element_id, size
+
+def parse_vint(data: bytes, offset: int) -> tuple[int, int]:
+    """ read_vint() on an in-memory buffer, returns the value (marker kept) and the offset after it. """
+
+    length = 1
+    while length <= 8 and not data[offset] & (0x80 >> (length - 1)):
+        length += 1
+    return int.from_bytes(data[offset:offset + length], "big"), offset + length
+
+def parse_children(data: bytes) -> list[tuple[int, bytes]]:
+    """ Splits the payload of a master element into (ID, payload) pairs. """
+
+    children = []
+    offset = 0
+    while offset < len(data):
+        element_id, offset = parse_vint(data, offset)
+        size, next_offset = parse_vint(data, offset)
+        size &= (1 << (7 * (next_offset - offset))) - 1 # Remove the length marker.
+        children.append((element_id, data[next_offset:next_offset + size]))
+        offset = next_offset + size
+
+    return children
+
+def parse_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+class WebMOpusSource(discord.AudioSource):
+    """ Opus audio source for WebM streams, started at position seconds. Seeking uses the file's Cues to find the cluster
+    containing the position, so it costs a single ranged request. Construction reads the headers and the first packet
+    and raises DemuxError if the stream isn't 20 ms Opus, it blocks and should run in a worker thread. """
+
+    def __init__(self, url: str, seconds: int, pool: ConnectionPool, buffer=None) -> None:
+        self.url: str = url
+        self.pool: ConnectionPool = pool
+        self.buffer = buffer # StreamBuffer still downloading the stream, read instead of the URL wherever it got to.
+        self.target: float = seconds * 1000 # Position in milliseconds, packets before it are dropped.
+        self.timecode_scale: int = 1000000 # Nanoseconds per timecode unit, Matroska's default.
+        self.track_number: int | None = None
+        self.cues: list[tuple[int, int]] = [] # (time in timecode units, cluster position relative to the segment data)
+        self.cues_position: int | None = None
+        self.segment_start: int = 0
+        self.cluster_time: int = 0
+        self.packets: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.closed: bool = False
+        self.reader: RangeReader = RangeReader(url, 0, pool, buffer)
+
+        try:
+            first_cluster = self.read_headers()
+            self.start(first_cluster)
+            first_packet = self.next_packet()
+        except (EOFError, IndexError, ValueError) as e:
+            self.reader.close()
+            raise DemuxError(f"Failed to parse WebM stream: {e}")
+        except Exception:
+            self.reader.close()
+            raise
+
+        if first_packet is None or get_opus_packet_duration(first_packet) != 20:
+            self.reader.close()
+            raise DemuxError("Stream doesn't contain 20 ms Opus packets")
+
+        self.packets.put(first_packet)
+        self.thread: threading.Thread = threading.Thread(target=self.demux, daemon=True)
+        self.thread.start()
+
+    def read_headers(self) -> int:
+        """ Reads the elements before the first cluster and returns the cluster's absolute position. """
+
+        element_id, size = read_element_header(self.reader)
+        if element_id != EBML_HEADER:
+            raise DemuxError("Not a Matroska file")
+        doc_type = dict(parse_children(self.reader.read(size))).get(DOC_TYPE, b"").decode()
+        if doc_type not in ("webm", "matroska"):
+            raise DemuxError(f"Unsupported document type \"{doc_type}\"")
+
+        element_id, size = read_element_header(self.reader)
+        if element_id != SEGMENT:
+            raise DemuxError("Missing segment")
+        self.segment_start = self.reader.position
+
+        while True:
+            position = self.reader.position
+            element_id, size = read_element_header(self.reader)
+
+            if element_id == CLUSTER:
+                break
+            if size == UNKNOWN_SIZE:
+                raise DemuxError("Unknown-size element before the first cluster")
+
+            if element_id == SEEK_HEAD:
+                self.parse_seek_head(self.reader.read(size))
+            elif element_id == INFO:
+                scale = dict(parse_children(self.reader.read(size))).get(TIMECODE_SCALE)
+                if scale:
+                    self.timecode_scale = parse_uint(scale)
+            elif element_id == TRACKS:
+                self.parse_tracks(self.reader.read(size))
+            elif element_id == CUES:
+                self.parse_cues(self.reader.read(size))
+            else:
+                self.reader.skip(size)
+
+        if self.track_number is None:
+            raise DemuxError("No Opus track")
+
+        return position
+
+    def parse_seek_head(self, data: bytes) -> None:
+        for element_id, payload in parse_children(data):
+            if element_id != SEEK:
+                continue
+            seek = dict(parse_children(payload))
+            if parse_uint(seek.get(SEEK_ID, b"")) == CUES and SEEK_POSITION in seek:
+                self.cues_position = parse_uint(seek[SEEK_POSITION])
+
+    def parse_tracks(self, data: bytes) -> None:
+        for element_id, payload in parse_children(data):
+            if element_id != TRACK_ENTRY:
+                continue
+            track = dict(parse_children(payload))
+            if track.get(CODEC_ID, b"").rstrip(b"\0") == b"A_OPUS":
+                self.track_number = parse_uint(track[TRACK_NUMBER])
+                return
+
+    def parse_cues(self, data: bytes) -> None:
+        for element_id, payload in parse_children(data):
+            if element_id != CUE_POINT:
+                continue
+            cue_point = parse_children(payload)
+            time = next((parse_uint(value) for child_id, value in cue_point if child_id == CUE_TIME), None)
+            for child_id, value in cue_point:
+                positions = dict(parse_children(value)) if child_id == CUE_TRACK_POSITIONS else {}
+                if time is not None and CUE_CLUSTER_POSITION in positions:
+                    self.cues.append((time, parse_uint(positions[CUE_CLUSTER_POSITION])))
+                    break
+
+        self.cues.sort()
+
+    def load_cues(self) -> None:
+        """ Reads the Cues element when it's stored after the clusters, its position is in the SeekHead. """
+
+        reader = RangeReader(self.url, self.segment_start + self.cues_position, self.pool, self.buffer)
+        try:
+            element_id, size = read_element_header(reader)
+            if element_id == CUES:
+                self.parse_cues(reader.read(size))
+        finally:
+            reader.close()
+
+    def start(self, first_cluster: int) -> None:
+        """ Moves the reader to the cluster containing the target position. The header of the first cluster was already read. """
+
+        if self.target and not self.cues and self.cues_position is not None:
+            self.load_cues()
+
+        target = self.target * 1000000 / self.timecode_scale
+        cluster = max((position for time, position in self.cues if time <= target), default=None)
+        if not self.target or cluster is None or self.segment_start + cluster <= first_cluster:
+            return # Start from the first cluster, its header is already consumed.
+
+        self.reader.close()
+        self.reader = RangeReader(self.url, self.segment_start + cluster, self.pool, self.buffer)
+
+    def next_packet(self) -> bytes | None:
+        """ Reads elements until the next Opus packet at or after the target position, None at the end of the stream. """
+
+        while not self.closed:
+            try:
+                element_id, size = read_element_header(self.reader)
+            except EOFError:
+                return None
+
+            if element_id in (SEGMENT, CLUSTER, BLOCK_GROUP):
+                continue # Descend into containers, every element inside is handled by this loop.
+            if element_id == TIMECODE:
+                self.cluster_time = parse_uint(self.reader.read(size))
+            elif element_id in (SIMPLE_BLOCK, BLOCK):
+                packet = self.parse_block(self.reader.read(size))
+                if packet is not None:
+                    return packet
+            elif size == UNKNOWN_SIZE:
+                raise DemuxError(f"Unknown-size element {element_id:#x}")
+            else:
+                self.reader.skip(size)
+
+        return None
+
+    def parse_block(self, data: bytes) -> bytes | None:
+        track, offset = parse_vint(data, 0)
+        track &= (1 << (7 * offset)) - 1
+        if track != self.track_number:
+            return None
+
+        if (data[offset + 2] >> 1) & 0x03:
+            raise DemuxError("Laced blocks are not supported")
+
+        relative_time = int.from_bytes(data[offset:offset + 2], "big", signed=True)
+        if (self.cluster_time + relative_time) * self.timecode_scale / 1000000 < self.target - 10: # 10 ms tolerance for timestamp rounding.
+            return None
+
+        return data[offset + 3:]
+
+    def demux(self) -> None:
+        try:
+            while not self.closed:
+                packet = self.next_packet()
+                if packet is None:
+                    break
+
+                while not self.closed:
+                    try:
+                        self.packets.put(packet, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception:
+            if not self.closed:
+                logging.error(f"An error occured while demuxing WebM stream in function demux(); {traceback.format_exc()}")
+        finally:
+            self.reader.close()
+            self.put_end()
+
+    def put_end(self) -> None:
+        while not self.closed:
+            try:
+                self.packets.put(None, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self) -> bytes:
+        try:
+            packet = self.packets.get(timeout=READ_TIMEOUT)
+        except queue.Empty:
+            logging.warning(f"No audio received for {READ_TIMEOUT} seconds in function read(), ending the stream.")
+            return b""
+
+        return packet if packet is not None else b""
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        self.closed = True # The demux thread stops and closes the reader.
@@ -0,0 +1,80 @@
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from typing import Iterator
+from yt_dlp import YoutubeDL
+
+""" Pool of long-lived YoutubeDL instances.
+Building a YoutubeDL loads the extractor registry, the cookie jar and the HTTP opener,
+so reusing instances keeps connections alive between extractions. """
+
+class YDLPool:
+    """ Hands out YoutubeDL instances to worker threads. An instance is only ever used by the
+    thread that checked it out, and is recycled after max_uses extractions or after an error. """
+
+    def __init__(self, options: dict, size: int, max_uses: int) -> None:
+        self.options: dict = options
+        self.size: int = size # Maximum amount of instances alive at the same time.
+        self.max_uses: int = max_uses # Instances are rebuilt after this many checkouts to avoid leaking state (cookies, caches) forever.
+        self.idle: list[tuple[YoutubeDL, int]] = [] # (instance, uses) pairs, used as a stack so the most recently used (warmest) instance is handed out first.
+        self.created: int = 0
+        self.condition: threading.Condition = threading.Condition() # Guards idle and created, waiters are woken when an instance is returned or discarded.
+
+    def acquire(self) -> tuple[YoutubeDL, int]:
+        with self.condition:
+            while not self.idle and self.created >= self.size: # Pool is full, wait for another thread to return or discard an instance.
+                self.condition.wait()
+
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+
+        try:
+            return YoutubeDL(self.options), 0
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, yt: YoutubeDL, uses: int, healthy: bool) -> None:
+        if healthy and uses < self.max_uses:
+            with self.condition:
+                self.idle.append((yt, uses))
+                self.condition.notify()
+            return
+
+        self.discard(yt)
+
+    def discard(self, yt: YoutubeDL) -> None:
+        try:
+            yt.close()
+        except Exception:
+            logging.error(f"Failed to close YoutubeDL instance in function discard(); {traceback.format_exc()}")
+        finally:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify() # A waiter can build a new instance in its place.
+
+    @contextmanager
+    def checkout(self) -> Iterator[YoutubeDL]:
+        """ Usage: with pool.checkout() as yt: yt.extract_info(...) """
+
+        yt, uses = self.acquire()
+        healthy = True
+        try:
+            yield yt
+        except Exception:
+            healthy = False # Don't hand out an instance that just failed, its opener might be in a broken state.
+            raise
+        finally:
+            self.release(yt, uses + 1, healthy)
+
+    def close(self) -> None:
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+
+        for yt, uses in idle:
+            self.discard(yt)